@@ -0,0 +1,355 @@
+'''
+Benchmarks for nska_deserialize on synthetic archives.
+
+Times this tree and, with --baseline, an older version of nska_deserialize.py
+and ccl_bplist.py (taken from a git ref, or a folder holding them), and prints
+both with the speedup. Each measurement runs in its own process, so the two
+versions never share imports, and one that takes longer than --timeout (or
+fails, eg: RecursionError) is reported as such.
+
+    python benchmarks/bench_nska.py --baseline <git ref>
+    python benchmarks/bench_nska.py --quick --only hexint,deep
+
+Cases
+    load    deserialize_plist() on an sfl2 like archive, binary and xml
+    hexint  deserialize_plist() on xml archives with 10^3 to 10^6 hex integers
+    deep    deserialize_plist_from_string() on deep (nested dicts or arrays)
+            and wide (one array of many items) archives
+    many    items/sec of deserialize_many() against a loop over
+            deserialize_plist_from_string()
+    json    write_plist_to_json_file() time and tracemalloc peak
+    json_backends
+            dumps_json() with each backend installed (json, orjson)
+    memory  tracemalloc retained/peak memory of ccl_bplist.load() and
+            deserialize_plist_from_string() on a large archive
+
+Only the standard library is needed to make the inputs. Versions before
+1.6.0 also need biplist installed to be timed.
+'''
+
+import argparse
+import gc
+import io
+import json
+import os
+import plistlib
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from plistlib import UID
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+module_names = ('nska_deserialize.py', 'ccl_bplist.py')
+
+# Input generators, return the archive as a plistlib object
+
+class ArchiveBuilder:
+    '''Builds an NSKeyedArchiver $objects table'''
+    def __init__(self):
+        self.objects = ['$null']
+        self.classes = {}
+
+    def add(self, obj):
+        self.objects.append(obj)
+        return UID(len(self.objects) - 1)
+
+    def cls(self, name):
+        if name not in self.classes:
+            self.classes[name] = self.add({'$classname': name, '$classes': [name, 'NSObject']})
+        return self.classes[name]
+
+    def dict(self, keys, values):
+        return self.add({'$class': self.cls('NSDictionary'), 'NS.keys': [self.add(k) for k in keys], 'NS.objects': values})
+
+    def array(self, values):
+        return self.add({'$class': self.cls('NSArray'), 'NS.objects': values})
+
+    def date(self, seconds):
+        return self.add({'$class': self.cls('NSDate'), 'NS.time': seconds})
+
+    def archive(self, root):
+        return {'$archiver': 'NSKeyedArchiver', '$version': 100000, '$top': {'root': root}, '$objects': self.objects}
+
+def sfl2_archive(items):
+    '''A list of dicts with a url, name and date, like an sfl2 recent items list'''
+    b = ArchiveBuilder()
+    rows = []
+    for i in range(items):
+        values = [b.add('file:///Users/user/Documents/doc{}.txt'.format(i)), b.add('doc {}'.format(i)), b.date(600000000.0 + i)]
+        rows.append(b.dict(['URL', 'name', 'date'], values))
+    return b.archive(b.dict(['items', 'creationDate'], [b.array(rows), b.date(1.0)]))
+
+def deep_archive(depth, kind):
+    '''Dicts (or arrays) nested depth levels deep'''
+    b = ArchiveBuilder()
+    child = b.add('leaf')
+    for i in range(depth):
+        if kind == 'dict':
+            child = b.dict(['level', 'child'], [b.add(i), child])
+        else:
+            child = b.array([b.add(i), child])
+    return b.archive(child)
+
+def wide_archive(items):
+    '''One array of items objects'''
+    b = ArchiveBuilder()
+    item_class = b.cls('Item')
+    rows = [b.add({'$class': item_class, 'v': b.add(i), 's': b.add('s{}'.format(i))}) for i in range(items)]
+    return b.archive(b.array(rows))
+
+def hexint_xml(count):
+    '''An xml archive of an array of count integers written in hex, as some
+       macOS Big Sur plists have them, which plistlib can not read'''
+    b = ArchiveBuilder()
+    root = b.array([b.add(i * 7919) for i in range(count)])
+    xml = dump_xml(b.archive(root))
+    start = xml.index(b'<key>$objects</key>')
+    head, tail = xml[:start], xml[start:]
+    lines = tail.split(b'\n')
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(b'<integer>'):
+            value = int(stripped[9:-10])
+            lines[index] = line.replace(stripped, b'<integer>0x%x</integer>' % value)
+    return head + b'\n'.join(lines)
+
+def pack_blobs(blobs):
+    return b''.join(struct.pack('<I', len(blob)) + blob for blob in blobs)
+
+def read_blobs(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    blobs = []
+    offset = 0
+    while offset < len(data):
+        size, = struct.unpack_from('<I', data, offset)
+        blobs.append(data[offset + 4:offset + 4 + size])
+        offset += 4 + size
+    return blobs
+
+def dump_binary(archive):
+    return plistlib.dumps(archive, fmt=plistlib.FMT_BINARY, sort_keys=False)
+
+def xml_uids(value):
+    '''Returns value with UIDs as CF$UID dicts, which is how xml archives have them'''
+    if isinstance(value, UID):
+        return {'CF$UID': value.data}
+    if isinstance(value, dict):
+        return {k: xml_uids(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [xml_uids(v) for v in value]
+    return value
+
+def dump_xml(archive):
+    return plistlib.dumps(xml_uids(archive), fmt=plistlib.FMT_XML, sort_keys=False)
+
+def make_inputs(folder, quick, cases):
+    '''Writes the inputs of cases to folder, returns [(case, input name), ..] in run order'''
+    scale = 10 if quick else 1
+    runs = []
+    def save(case, name, make):
+        if case not in cases:
+            return
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(make())
+        runs.append((case, name))
+
+    save('load', 'sfl2.bplist', lambda: dump_binary(sfl2_archive(20000 // scale)))
+    save('load', 'sfl2.xml', lambda: dump_xml(sfl2_archive(20000 // scale)))
+    for power in range(3, 6 if quick else 7):
+        save('hexint', 'hexint_1e{}.xml'.format(power), lambda: hexint_xml(10 ** power))
+    for depth in (300, 3000):
+        save('deep', 'deep_dict_{}.bplist'.format(depth), lambda: dump_binary(deep_archive(depth, 'dict')))
+    save('deep', 'deep_array_3000.bplist', lambda: dump_binary(deep_archive(3000, 'array')))
+    save('deep', 'wide_{}.bplist'.format(50000 // scale), lambda: dump_binary(wide_archive(50000 // scale)))
+    save('many', 'many.blobs', lambda: pack_blobs([dump_binary(sfl2_archive(20)) for _ in range(2000 // scale)]))
+    save('json', 'sfl2.bplist', lambda: dump_binary(sfl2_archive(20000 // scale)))
+    save('json_backends', 'sfl2.bplist', lambda: dump_binary(sfl2_archive(20000 // scale)))
+    save('memory', 'large.bplist', lambda: dump_binary(sfl2_archive(50000 // scale)))
+    return runs
+
+# Measurements, run in a child process with the version under test on sys.path
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def traced_memory(function):
+    '''Returns (result, retained bytes, peak bytes) of function()'''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, retained, peak
+
+def measure_load(nd, path, repeat):
+    return [('deserialize_plist', best_time(lambda: nd.deserialize_plist(path), repeat), 's')]
+
+def measure_deep(nd, path, repeat):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [('deserialize_plist_from_string', best_time(lambda: nd.deserialize_plist_from_string(data), repeat), 's')]
+
+def measure_many(nd, path, repeat):
+    blobs = read_blobs(path)
+    def loop():
+        results = []
+        for blob in blobs:
+            try:
+                results.append(nd.deserialize_plist_from_string(blob))
+            except Exception as ex:
+                results.append(ex)
+        return results
+    measured = [('loop over deserialize_plist_from_string', len(blobs) / best_time(loop, repeat), 'items/s')]
+    if hasattr(nd, 'deserialize_many'):
+        for workers in sorted({1, os.cpu_count() or 1}):
+            elapsed = best_time(lambda: nd.deserialize_many(blobs, workers=workers), repeat)
+            measured.append(('deserialize_many workers={}'.format(workers), len(blobs) / elapsed, 'items/s'))
+    return measured
+
+def measure_json(nd, path, repeat):
+    plist = nd.deserialize_plist(path)
+    output_path = path + '.json'
+    write = lambda: nd.write_plist_to_json_file(plist, output_path)
+    measured = [('write_plist_to_json_file', best_time(write, repeat), 's')]
+    _, _, peak = traced_memory(write)
+    measured.append(('write_plist_to_json_file peak', peak / 1e6, 'MB'))
+    os.remove(output_path)
+    return measured
+
+def measure_json_backends(nd, path, repeat):
+    if not hasattr(nd, 'dumps_json'): # older versions only have the json module writer
+        return []
+    plist = nd.deserialize_plist(path)
+    measured = []
+    for backend in ('json', 'orjson'):
+        try:
+            nd.dumps_json([], backend=backend)
+        except ImportError:
+            continue
+        elapsed = best_time(lambda: nd.dumps_json(plist, iso_dates=True, native_numbers=True, backend=backend), repeat)
+        measured.append(('dumps_json backend={}'.format(backend), elapsed, 's'))
+    return measured
+
+def measure_memory(nd, path, repeat):
+    import ccl_bplist
+    with open(path, 'rb') as f:
+        data = f.read()
+    loaded, retained, peak = traced_memory(lambda: ccl_bplist.load(io.BytesIO(data)))
+    del loaded
+    measured = [('ccl_bplist.load retained', retained / 1e6, 'MB'), ('ccl_bplist.load peak', peak / 1e6, 'MB')]
+    plist, retained, peak = traced_memory(lambda: nd.deserialize_plist_from_string(data))
+    del plist
+    measured.append(('deserialize_plist_from_string retained', retained / 1e6, 'MB'))
+    measured.append(('deserialize_plist_from_string peak', peak / 1e6, 'MB'))
+    return measured
+
+measures = {'load': measure_load, 'hexint': measure_load, 'deep': measure_deep, 'many': measure_many,
+            'json': measure_json, 'json_backends': measure_json_backends, 'memory': measure_memory}
+
+def run_child(source_dir, case, path, repeat):
+    '''Prints the measurements of case on path as json, with the modules from source_dir'''
+    sys.path.insert(0, source_dir)
+    import nska_deserialize as nd
+    try:
+        measured = measures[case](nd, path, repeat)
+    except Exception as ex: # reported as the result, eg: RecursionError on the old version
+        measured = [('error', type(ex).__name__, '')]
+    print(json.dumps(measured))
+
+# Running and reporting
+
+def baseline_dir(baseline, folder):
+    '''Returns a folder with the baseline modules, baseline is a folder or a git ref'''
+    if os.path.isdir(baseline):
+        return os.path.abspath(baseline)
+    target = os.path.join(folder, 'baseline')
+    os.mkdir(target)
+    for name in module_names:
+        source = subprocess.run(['git', '-C', repo_dir, 'show', '{}:{}'.format(baseline, name)],
+                                stdout=subprocess.PIPE, check=True).stdout
+        with open(os.path.join(target, name), 'wb') as f:
+            f.write(source)
+    return target
+
+def run_measurement(source_dir, case, path, repeat, timeout):
+    '''Returns {label: (value, unit)} of case on path, in a new process'''
+    command = [sys.executable, os.path.abspath(__file__), '--child', source_dir, case, path, str(repeat)]
+    try:
+        output = subprocess.run(command, stdout=subprocess.PIPE, timeout=timeout, check=True, cwd=os.path.dirname(path)).stdout
+    except subprocess.TimeoutExpired:
+        return {'error': ('> {}s'.format(timeout), '')}
+    except subprocess.CalledProcessError as ex:
+        return {'error': ('exit code {}'.format(ex.returncode), '')}
+    return {label: (value, unit) for label, value, unit in json.loads(output.decode('utf8').splitlines()[-1])}
+
+def format_value(measured):
+    value, unit = measured
+    if isinstance(value, str):
+        return value
+    if unit == 's':
+        return '{:.4f} s'.format(value) if value < 1 else '{:.2f} s'.format(value)
+    if unit == 'items/s':
+        return '{:.0f} items/s'.format(value)
+    return '{:.1f} {}'.format(value, unit)
+
+def speedup(old, new):
+    '''How many times better new is than old'''
+    (old_value, unit), (new_value, _) = old, new
+    if isinstance(old_value, str) or isinstance(new_value, str) or not old_value or not new_value:
+        return ''
+    ratio = new_value / old_value if unit == 'items/s' else old_value / new_value
+    return '{:.2f}x'.format(ratio)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks nska_deserialize on synthetic archives')
+    parser.add_argument('--baseline', help='git ref or folder with the old nska_deserialize.py and ccl_bplist.py to compare with')
+    parser.add_argument('--only', help='Comma separated cases to run: ' + ', '.join(measures))
+    parser.add_argument('--quick', action='store_true', help='Smaller inputs (up to 10^5 hex integers)')
+    parser.add_argument('--repeat', type=int, default=3, help='Times each measurement is repeated, the best is shown (default 3)')
+    parser.add_argument('--timeout', type=int, default=300, help='Seconds before a measurement is given up (default 300)')
+    args = parser.parse_args(argv)
+    only = set(args.only.split(',')) if args.only else set(measures)
+    unknown = only - set(measures)
+    if unknown:
+        parser.error('unknown case: ' + ', '.join(sorted(unknown)))
+
+    with tempfile.TemporaryDirectory() as folder:
+        runs = make_inputs(folder, args.quick, only)
+        versions = [('current', repo_dir)]
+        if args.baseline:
+            versions.insert(0, ('baseline', baseline_dir(args.baseline, folder)))
+        print('{:13} {:22} {:42}'.format('case', 'input', 'measure') + ''.join('{:>18}'.format(v) for v, _ in versions) +
+              ('{:>10}'.format('speedup') if args.baseline else ''))
+        for case, name in runs:
+            path = os.path.join(folder, name)
+            results = [run_measurement(source_dir, case, path, args.repeat, args.timeout) for _, source_dir in versions]
+            labels = []
+            for result in results:
+                labels.extend(label for label in result if label not in labels)
+            for label in labels:
+                cells = [result.get(label, ('-', '')) for result in results]
+                line = '{:13} {:22} {:42}'.format(case, name, label) + ''.join('{:>18}'.format(format_value(c)) for c in cells)
+                if len(cells) == 2:
+                    line += '{:>10}'.format(speedup(*cells))
+                print(line, flush=True)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 6 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+    else:
+        main()
@@ -28,16 +28,23 @@ Some modifications have been made to fix errors.- Yogesh Khatri
 
 """
 
-import sys
 import os
+import io
+import mmap
+import stat
 import struct
+import contextlib
+import collections.abc
 import datetime
+import logging
 from uuid import UUID
 
 __version__ = "0.16"
 __description__ = "Converts Apple binary PList files into a native Python data structure"
 __contact__ = "Alex Caithness"
 
+log = logging.getLogger(__name__)
+
 _object_converter = None
 def set_object_converter(function):
     """Sets the object converter function to be used when retrieving objects from the bplist.
@@ -54,8 +61,34 @@ class BplistError(Exception):
     pass
 
 class BplistUID:
-    def __init__(self, value):
-        self.value = value
+    """A UID (object reference). Instances have no __dict__ and compare and hash
+    by value. UIDs below _uid_intern_limit are interned, BplistUID(n) returns the
+    same object every time, so value is read only."""
+    __slots__ = ("value",)
+
+    def __new__(cls, value):
+        if cls is BplistUID and type(value) is int and 0 <= value < _uid_intern_limit:
+            return _interned_uids[value]
+        self = object.__new__(cls)
+        _set_uid_value(self, value)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BplistUID is read only")
+
+    def __delattr__(self, name):
+        raise AttributeError("BplistUID is read only")
+
+    def __reduce__(self):
+        return (type(self), (self.value,))
+
+    def __eq__(self, other):
+        if isinstance(other, BplistUID):
+            return self.value == other.value
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.value)
 
     def __repr__(self):
         return "UID: {0}".format(self.value)
@@ -63,6 +96,16 @@ class BplistUID:
     def __str__(self):
         return self.__repr__()
 
+_set_uid_value = BplistUID.value.__set__ # the slot's setter, bypassing __setattr__
+
+def _new_uid(value):
+    uid = object.__new__(BplistUID)
+    _set_uid_value(uid, value)
+    return uid
+
+_uid_intern_limit = 4096
+_interned_uids = tuple(_new_uid(value) for value in range(_uid_intern_limit))
+
 def __decode_multibyte_int_val(b):
     if len(b) == 1:
         fmt = ">B"
@@ -115,15 +158,134 @@ def __decode_float(b, signed=True):
     else:
         return struct.unpack(fmt.upper(), b)[0]
 
-def __decode_object(f, offset, collection_offset_size, offset_table):
-    # Move to offset and read type
+_uint_formats = {2: ">H", 4: ">I", 8: ">Q"}
+
+def __decode_uint(buf, offset, size):
+    """Decodes a big endian unsigned int of size bytes at offset in buf"""
+    if size == 1:
+        return buf[offset]
+    elif size == 3:
+        return (buf[offset] << 16) | (buf[offset + 1] << 8) | buf[offset + 2]
+    fmt = _uint_formats.get(size)
+    if fmt is None:
+        raise BplistError("Cannot decode multibyte int of length {0}".format(size))
+    return struct.unpack_from(fmt, buf, offset)[0]
+
+_uint_codes = {2: "H", 4: "I", 8: "Q"}
+
+def __decode_uints(buf, offset, count, size):
+    """Decodes count big endian unsigned ints of size bytes each, starting at offset in buf,
+    all at once. Returns a list or tuple"""
+    end = offset + count * size
+    if offset < 0 or end > len(buf):
+        raise BplistError("Corrupt binary plist: {0} ints of {1} bytes at offset {2} go past the end of the data".format(count, size, offset))
+    if size == 1:
+        return buf[offset:end].tolist()
+    elif size == 3:
+        # Widen to 4 bytes (a leading zero each) and unpack them as one array
+        packed = bytes(buf[offset:end])
+        widened = bytearray(count * 4)
+        widened[1::4] = packed[0::3]
+        widened[2::4] = packed[1::3]
+        widened[3::4] = packed[2::3]
+        return struct.unpack(">{0}I".format(count), widened)
+    code = _uint_codes.get(size)
+    if code is None:
+        raise BplistError("Cannot decode multibyte int of length {0}".format(size))
+    return struct.unpack_from(">{0}{1}".format(count, code), buf, offset)
+
+def __decode_length(buf, offset, type_byte, type_name):
+    """Returns a tuple (length, data_offset) for the variable length object at offset.
+    The length is held in the 4 lsb of the type byte, or in a following int object"""
+    if type_byte & 0x0F != 0x0F:
+        return type_byte & 0x0F, offset + 1
+    int_type_byte = buf[offset + 1]
+    if int_type_byte & 0xF0 != 0x10:
+        raise BplistError("Long {0} field definition not followed by int type at offset {1}".format(type_name, offset + 2))
+    int_length = 2 ** (int_type_byte & 0x0F)
+    return __decode_uint(buf, offset + 2, int_length), offset + 2 + int_length
+
+def __decode_refs(buf, offset, count, collection_offset_size):
+    """Returns the count object references starting at offset"""
+    return __decode_uints(buf, offset, count, collection_offset_size)
+
+def __decode_collection_refs(buf, offset, type_byte, collection_offset_size):
+    """Returns the object references of the array, set or dict at offset. For a dict,
+    all the key references come first, followed by all the value references"""
+    if type_byte & 0xF0 == 0xA0: # Array  1010 nnnn
+        array_count, refs_offset = __decode_length(buf, offset, type_byte, "Array")
+        return __decode_refs(buf, refs_offset, array_count, collection_offset_size)
+    elif type_byte & 0xF0 == 0xC0: # Set  1100 nnnn
+        set_count, refs_offset = __decode_length(buf, offset, type_byte, "Set")
+        return __decode_refs(buf, refs_offset, set_count, collection_offset_size)
+    else: # Dict  1101 nnnn
+        dict_count, refs_offset = __decode_length(buf, offset, type_byte, "Dict")
+        #print("Dictionary count: {0}".format(dict_count))
+        return __decode_refs(buf, refs_offset, dict_count * 2, collection_offset_size)
+
+_collection_types = (0xA0, 0xC0, 0xD0)
+_not_decoded = object()
+
+def __decode_object(buf, obj_ref, collection_offset_size, offset_table, object_cache):
+    """Decodes the object at index obj_ref of the offset table. Arrays, sets and dicts
+    are decoded with an explicit stack rather than by recursion, so deeply nested plists
+    are not limited by the recursion limit. If object_cache is a list (one slot per object),
+    each object is only decoded once and every reference to it returns the same python object"""
+    if object_cache is not None and object_cache[obj_ref] is not _not_decoded:
+        return object_cache[obj_ref]
+    offset = offset_table[obj_ref]
+    type_byte = buf[offset]
+    if type_byte & 0xF0 not in _collection_types:
+        value = __decode_scalar(buf, offset, type_byte)
+        if object_cache is not None:
+            object_cache[obj_ref] = value
+        return value
+
+    # Frames of (collection type, obj_ref, refs, decoded items)
+    stack = [(type_byte & 0xF0, obj_ref, __decode_collection_refs(buf, offset, type_byte, collection_offset_size), [])]
+    on_stack = {obj_ref}
+    while True:
+        collection_type, collection_ref, refs, items = stack[-1]
+        for i in range(len(items), len(refs)):
+            obj_ref = refs[i]
+            if object_cache is not None:
+                value = object_cache[obj_ref]
+                if value is not _not_decoded:
+                    items.append(value)
+                    continue
+            offset = offset_table[obj_ref]
+            type_byte = buf[offset]
+            if type_byte & 0xF0 in _collection_types:
+                # Descend into the nested collection, this frame is resumed once it is built
+                if obj_ref in on_stack:
+                    raise BplistError("Cyclic reference to object {0} at offset {1}".format(obj_ref, offset))
+                stack.append((type_byte & 0xF0, obj_ref, __decode_collection_refs(buf, offset, type_byte, collection_offset_size), []))
+                on_stack.add(obj_ref)
+                break
+            value = __decode_scalar(buf, offset, type_byte)
+            if object_cache is not None:
+                object_cache[obj_ref] = value
+            items.append(value)
+        else:
+            # All items are decoded, build the collection and hand it to the parent frame
+            stack.pop()
+            on_stack.discard(collection_ref)
+            if collection_type == 0xD0:
+                dict_count = len(refs) // 2
+                value = dict(zip(items[:dict_count], items[dict_count:]))
+            else:
+                value = items
+            if object_cache is not None:
+                object_cache[collection_ref] = value
+            if not stack:
+                return value
+            stack[-1][3].append(value)
+
+def __decode_scalar(buf, offset, type_byte):
+    # Decodes any object other than array/set/dict, buf is a memoryview over the whole bplist.
+    # Helpers get bytes, not slices of buf: a slice kept alive by a traceback would stop
+    # open_buffer() from closing the mmap (BufferError)
     #print("Decoding object at offset {0}".format(offset))
-    f.seek(offset)
-    # A little hack to keep the script portable between py2.x and py3k
-    if sys.version_info[0] < 3:
-        type_byte = ord(f.read(1)[0])
-    else:
-        type_byte = f.read(1)[0]
     #print("Type byte: {0}".format(hex(type_byte)))
     if type_byte == 0x00: # Null      0000 0000
         return None
@@ -132,170 +294,169 @@ def __decode_object(f, offset, collection_offset_size, offset_table):
     elif type_byte == 0x09: # True    0000 1001
         return True
     elif type_byte == 0x0F: # Fill    0000 1111
-        raise BplistError("Fill type not currently supported at offset {0}".format(f.tell())) # Not sure what to return really...
+        raise BplistError("Fill type not currently supported at offset {0}".format(offset + 1)) # Not sure what to return really...
     elif type_byte & 0xF0 == 0x10: # Int    0001 xxxx
         int_length = 2 ** (type_byte & 0x0F)
-        int_bytes = f.read(int_length)
-        return __decode_multibyte_int_val(int_bytes)
+        return __decode_multibyte_int_val(bytes(buf[offset + 1:offset + 1 + int_length]))
     elif type_byte & 0xF0 == 0x20: # Float   0010 nnnn
         float_length = 2 ** (type_byte & 0x0F)
-        float_bytes = f.read(float_length)
-        return __decode_float(float_bytes)
+        return __decode_float(bytes(buf[offset + 1:offset + 1 + float_length]))
     elif type_byte & 0xFF == 0x33: # Date   0011 0011
-        date_bytes = f.read(8)
-        date_value = __decode_float(date_bytes)
+        date_value = struct.unpack_from(">d", buf, offset + 1)[0]
         try:
             result = datetime.datetime(2001,1,1) + datetime.timedelta(seconds = date_value)
         except OverflowError:
             result = datetime.datetime.min
         return result
     elif type_byte & 0xF0 == 0x40: # Data   0100 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            data_length = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Data field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            data_length = __decode_multibyte_int(int_bytes, False)
-        return f.read(data_length)
+        data_length, data_offset = __decode_length(buf, offset, type_byte, "Data")
+        return bytes(buf[data_offset:data_offset + data_length])
     elif type_byte & 0xF0 == 0x50: # ASCII  0101 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            ascii_length = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long ASCII field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            ascii_length = __decode_multibyte_int(int_bytes, False)
-        return f.read(ascii_length).decode("ascii")
+        ascii_length, data_offset = __decode_length(buf, offset, type_byte, "ASCII")
+        return str(buf[data_offset:data_offset + ascii_length], "ascii")
     elif type_byte & 0xF0 == 0x60: # UTF-16  0110 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            utf16_length = (type_byte & 0x0F) * 2 # Length is characters - 16bit width
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long UTF-16 field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            utf16_length = __decode_multibyte_int(int_bytes, False) * 2
-        return f.read(utf16_length).decode("utf_16_be")
+        utf16_length, data_offset = __decode_length(buf, offset, type_byte, "UTF-16")
+        utf16_length *= 2 # Length is characters - 16bit width
+        return str(buf[data_offset:data_offset + utf16_length], "utf_16_be")
     elif type_byte & 0xF0 == 0x80: # UID    1000 nnnn
         uid_length = (type_byte & 0x0F) + 1
-        uid_bytes = f.read(uid_length)
-        return BplistUID(__decode_multibyte_int(uid_bytes, signed=False))
-    elif type_byte & 0xF0 == 0xA0: # Array  1010 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            array_count = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Array field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            array_count = __decode_multibyte_int(int_bytes, signed=False)
-        array_refs = []
-        for i in range(array_count):
-            array_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        return [__decode_object(f, offset_table[obj_ref], collection_offset_size, offset_table) for obj_ref in array_refs]
-    elif type_byte & 0xF0 == 0xC0: # Set  1010 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            set_count = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Set field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            set_count = __decode_multibyte_int(int_bytes, signed=False)
-        set_refs = []
-        for i in range(set_count):
-            set_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        return [__decode_object(f, offset_table[obj_ref], collection_offset_size, offset_table) for obj_ref in set_refs]
-    elif type_byte & 0xF0 == 0xD0: # Dict  1011 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            dict_count = type_byte & 0x0F
+        return BplistUID(__decode_uint(buf, offset + 1, uid_length))
+
+
+@contextlib.contextmanager
+def open_buffer(f):
+    """
+    Context manager which provides the whole of a binary property list as a read-only memoryview.
+    f may be a path, a bytes-like object or a file-like object (must support reading and seeking).
+    Paths and real files are memory mapped, BytesIO objects are used without copying their
+    contents, other file-like objects are read in full.
+    """
+    if isinstance(f, (bytes, bytearray, memoryview)):
+        buf = memoryview(f)
+        try:
+            yield buf
+        finally:
+            buf.release()
+    elif isinstance(f, str):
+        with open(f, "rb") as opened_file:
+            with open_buffer(opened_file) as buf:
+                yield buf
+    else:
+        mapped = None
+        if isinstance(f, io.BytesIO):
+            buf = f.getbuffer()
         else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
+            try:
+                fileno = f.fileno()
+            except (AttributeError, OSError, ValueError):
+                fileno = None
+            if fileno is not None and stat.S_ISREG(os.fstat(fileno).st_mode) and os.fstat(fileno).st_size > 0:
+                mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+                buf = memoryview(mapped)
             else:
-                int_type_byte = f.read(1)[0]
-            #print("Dictionary length int byte: {0}".format(hex(int_type_byte)))
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Dict field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            dict_count = __decode_multibyte_int(int_bytes, signed=False)
-        key_refs = []
-        #print("Dictionary count: {0}".format(dict_count))
-        for i in range(dict_count):
-            key_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        value_refs = []
-        for i in range(dict_count):
-            value_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        
-        dict_result = {}
-        for i in range(dict_count):
-            #print("Key ref: {0}\tVal ref: {1}".format(key_refs[i], value_refs[i]))
-            key = __decode_object(f, offset_table[key_refs[i]], collection_offset_size, offset_table)
-            val = __decode_object(f, offset_table[value_refs[i]], collection_offset_size, offset_table)
-            dict_result[key] = val
-        return dict_result
-
-
-def load(f):
+                f.seek(0)
+                buf = memoryview(f.read())
+        try:
+            yield buf
+        finally:
+            buf.release()
+            if mapped is not None:
+                try:
+                    mapped.close()
+                except BufferError:
+                    # A slice of buf is still referenced (eg: from a traceback), the
+                    # map is closed once that is freed
+                    pass
+
+
+def loads(data, cache_objects=True):
     """
-    Reads and converts a file-like object containing a binary property list.
-    Takes a file-like object (must support reading and seeking) as an argument
+    Converts a bytes-like object (bytes, bytearray, memoryview, mmap) containing a binary property list.
+    By default every object is decoded once, objects referenced from several places are returned
+    as the same python object. Set cache_objects=False to get a separate copy at every reference.
     Returns a data structure representing the data in the property list
     """
+    buf = data if isinstance(data, memoryview) else memoryview(data)
     # Check magic number
-    if f.read(8) != b"bplist00":
+    if buf[0:8] != b"bplist00":
         raise BplistError("Bad file header")
 
     # Read trailer
-    f.seek(-32, os.SEEK_END)
-    trailer = f.read(32)
-    offset_int_size, collection_offset_size, object_count, top_level_object_index, offest_table_offset = struct.unpack(">6xbbQQQ", trailer)
-
-    # Read offset table
-    f.seek(offest_table_offset)
-    offset_table = []
-    for i in range(object_count):
-        offset_table.append(__decode_multibyte_int(f.read(offset_int_size), False))
-    
-    return __decode_object(f, offset_table[top_level_object_index], collection_offset_size, offset_table)
+    if len(buf) < 40:
+        raise BplistError("File too short to be a binary plist")
+    offset_int_size, collection_offset_size, object_count, top_level_object_index, offest_table_offset = struct.unpack_from(">6xbbQQQ", buf, len(buf) - 32)
+
+    try:
+        # Read offset table
+        offset_table = __decode_uints(buf, offest_table_offset, object_count, offset_int_size)
+
+        object_cache = [_not_decoded] * object_count if cache_objects else None
+        return __decode_object(buf, top_level_object_index, collection_offset_size, offset_table, object_cache)
+    except (IndexError, struct.error) as ex:
+        raise BplistError("Corrupt binary plist: {0}".format(ex))
 
 
+def load(f, cache_objects=True):
+    """
+    Reads and converts a file-like object containing a binary property list.
+    Takes a file-like object (must support reading and seeking), a path or a bytes-like object as an argument.
+    The data is decoded in place from a memoryview (memory mapped for paths and real files).
+    See loads() for cache_objects.
+    Returns a data structure representing the data in the property list
+    """
+    with open_buffer(f) as buf:
+        return loads(buf, cache_objects)
+
+
+_class_converters = {} # $classname -> (required keys, converter function)
+
+def register_class_converter(classnames, function, required_keys=()):
+    """Registers function as the converter which NSKeyedArchiver_common_objects_convertor() uses
+    for objects whose $classname is classnames (a class name or a list/tuple of them). The object
+    (an NsKeyedArchiverDictionary) is passed to function only if it has all of required_keys, else
+    it is left unchanged. function returns the converted value. Registering a class name again
+    replaces its converter, eg: to add NSURL:
+
+    register_class_converter("NSURL", lambda obj: obj["NS.relative"], ("NS.relative",))
+
+    The registered converters are global, they apply to every archive converted in the process
+    (every thread and nska_deserialize.Deserializer), and registering is not synchronised with
+    conversions running in other threads. Register converters once at startup, before any
+    archives are converted."""
+    if not hasattr(function, "__call__"):
+        raise TypeError("function is not a function")
+    if isinstance(classnames, str):
+        classnames = (classnames,)
+    for classname in classnames:
+        _class_converters[classname] = (tuple(required_keys), function)
+
+def get_classname(obj):
+    """Returns the $classname of an NSKeyedArchiver object (a dict with a $class entry) or None.
+    For NsKeyedArchiverDictionary objects the $class uid is looked up directly in the object table,
+    class names are cached once per archive when the table is a NsKeyedArchiverObjectTable"""
+    if isinstance(obj, NsKeyedArchiverDictionary):
+        class_ref = obj.original.get("$class")
+    elif isinstance(obj, dict):
+        class_ref = obj.get("$class")
+    else:
+        return None
+    if class_ref is None:
+        return None
+    if isinstance(class_ref, BplistUID) and isinstance(obj, NsKeyedArchiverDictionary):
+        object_table = obj.object_table
+        classnames = getattr(object_table, "classnames", None)
+        if classnames is not None and class_ref.value in classnames:
+            return classnames[class_ref.value]
+        class_obj = object_table[class_ref.value]
+        classname = class_obj.get("$classname") if isinstance(class_obj, collections.abc.Mapping) else None
+        if isinstance(classname, str) and classname != "$null":
+            if classnames is not None:
+                classnames[class_ref.value] = classname
+            return classname
+    class_obj = obj["$class"]
+    classname = class_obj.get("$classname") if isinstance(class_obj, collections.abc.Mapping) else None
+    return classname if isinstance(classname, str) else None
+
 def NSKeyedArchiver_common_objects_convertor(o):
     """Built in converter function (suitable for submission to set_object_converter()) which automatically
     converts the following common data-types found in NSKeyedArchiver:
@@ -304,24 +465,20 @@ def NSKeyedArchiver_common_objects_convertor(o):
     NSSet/NSMutableSet
     NSString/NSMutableString
     NSDate
-    $null strings"""
-    # Conversion: NSDictionary
-    if is_nsmutabledictionary(o):
-        return convert_NSMutableDictionary(o)
-    # Conversion: NSArray
-    elif is_nsarray(o):
-        return convert_NSArray(o)
-    elif is_isnsset(o):
-        return convert_NSSet(o)
-    # Conversion: NSString
-    elif is_nsstring(o):
-        return convert_NSString(o)
-    # Conversion: NSDate
-    elif is_nsdate(o):
-        return convert_NSDate(o)
-    # Conversion: NSUUID
-    elif is_nsuuid(o):
-        return convert_NSUUID(o)
+    NSUUID
+    $null strings
+    Objects are dispatched on their $classname with a single lookup, more types can be added with
+    register_class_converter()"""
+    classname = get_classname(o)
+    if classname is not None:
+        entry = _class_converters.get(classname)
+        if entry is None:
+            return o
+        required_keys, function = entry
+        for key in required_keys:
+            if key not in o:
+                return o
+        return function(o)
     # Conversion: "$null" string
     elif isinstance(o, str) and o == "$null":
         return None
@@ -329,6 +486,19 @@ def NSKeyedArchiver_common_objects_convertor(o):
     else:
         return o
 
+_module_converter = object() # Default for converter arguments, use the converter from set_object_converter()
+
+class NsKeyedArchiverObjectTable(list):
+    """The $objects table of an NSKeyedArchiver along with the object converter to use
+    for this archive, and a cache of resolved class names (uid -> $classname). When NSKeyedArchiver_convert() and the NsKeyedArchiver wrapper types
+    are given one of these as object_table, its converter is used instead of the module level
+    one from set_object_converter(), so several archives can be converted at the same time
+    (eg: from different threads) each with their own converter."""
+    def __init__(self, objects, converter=None):
+        super(NsKeyedArchiverObjectTable, self).__init__(objects)
+        self.converter = converter
+        self.classnames = {}
+
 def NSKeyedArchiver_convert(o, object_table):
     if isinstance(o, list):
         #return NsKeyedArchiverList(o, object_table)
@@ -343,42 +513,98 @@ def NSKeyedArchiver_convert(o, object_table):
         #return o
         result = o
 
-    if _object_converter:
-        return _object_converter(result)
+    if isinstance(object_table, NsKeyedArchiverObjectTable):
+        converter = object_table.converter
+    else:
+        converter = _object_converter
+    if converter:
+        return converter(result)
     else:
         return result
 
 
-class NsKeyedArchiverDictionary(dict):
+class NsKeyedArchiverDictionary(collections.abc.Mapping):
+    """Read only view of an archived dict (original), nothing is copied. Values read
+    with [] or get() are converted, keys(), items() and values() give the stored values."""
+    __slots__ = ("original", "object_table")
+
     def __init__(self, original_dict, object_table):
-        super(NsKeyedArchiverDictionary, self).__init__(original_dict)
+        self.original = original_dict
         self.object_table = object_table
 
     def __getitem__(self, index):
-        o = super(NsKeyedArchiverDictionary, self).__getitem__(index)
-        return NSKeyedArchiver_convert(o, self.object_table)
+        return NSKeyedArchiver_convert(self.original[index], self.object_table)
 
     def get(self, key, default=None):
-        return self[key] if key in self else default
+        return self[key] if key in self.original else default
+
+    def __contains__(self, key):
+        return key in self.original
+
+    def __iter__(self):
+        return iter(self.original)
+
+    def __len__(self):
+        return len(self.original)
+
+    def keys(self):
+        return self.original.keys()
+
+    def items(self):
+        return self.original.items()
+
+    def values(self):
+        return self.original.values()
+
+    def __eq__(self, other):
+        if isinstance(other, NsKeyedArchiverDictionary):
+            other = other.original
+        return self.original == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.original)
+
+class NsKeyedArchiverList(collections.abc.Sequence):
+    """Read only view of an archived list (original), nothing is copied. Items read
+    with [] or by iterating are converted."""
+    __slots__ = ("original", "object_table")
 
-class NsKeyedArchiverList(list):
     def __init__(self, original_iterable, object_table):
-        super(NsKeyedArchiverList, self).__init__(original_iterable)
+        self.original = original_iterable
         self.object_table = object_table
 
     def __getitem__(self, index):
-        o = super(NsKeyedArchiverList, self).__getitem__(index)
-        return NSKeyedArchiver_convert(o, self.object_table)
+        return NSKeyedArchiver_convert(self.original[index], self.object_table)
 
     def __iter__(self):
-        for o in super(NsKeyedArchiverList, self).__iter__():
-            yield NSKeyedArchiver_convert(o, self.object_table)
-        
+        object_table = self.object_table
+        for o in self.original:
+            yield NSKeyedArchiver_convert(o, object_table)
+
+    def __len__(self):
+        return len(self.original)
+
+    def __contains__(self, value):
+        return value in self.original
+
+    def __eq__(self, other):
+        if isinstance(other, NsKeyedArchiverList):
+            other = other.original
+        return self.original == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.original)
 
-def deserialise_NsKeyedArchiver(obj, parse_whole_structure=False):
+
+def deserialise_NsKeyedArchiver(obj, parse_whole_structure=False, converter=_module_converter):
     """Deserialises an NSKeyedArchiver bplist rebuilding the structure.
        obj should usually be the top-level object returned by the load()
-       function."""
+       function. If converter is given (a function, or None for raw objects)
+       it is used for this archive instead of the one set by set_object_converter()."""
     
     # Check that this is an archiver and version we understand
     if not isinstance(obj, dict):
@@ -389,6 +615,8 @@ def deserialise_NsKeyedArchiver(obj, parse_whole_structure=False):
         raise ValueError("obj does not contain a '$version' key or the '$version' is unrecognised")
 
     object_table = obj["$objects"]
+    if converter is not _module_converter:
+        object_table = NsKeyedArchiverObjectTable(object_table, converter)
     if "root" in obj["$top"] and not parse_whole_structure:
         return NSKeyedArchiver_convert(obj["$top"]["root"], object_table)
     else:
@@ -396,7 +624,7 @@ def deserialise_NsKeyedArchiver(obj, parse_whole_structure=False):
     
 # NSMutableDictionary convenience functions
 def is_nsmutabledictionary(obj):
-    if not isinstance(obj, dict):
+    if not isinstance(obj, collections.abc.Mapping):
         return False
     if "$class" not in obj.keys():
         return False
@@ -421,31 +649,111 @@ def convert_NSMutableDictionary(obj):
     
     if not is_nsmutabledictionary(obj):
         raise ValueError("obj does not have the correct structure for a NSDictionary/NSMutableDictionary serialised to a NSKeyedArchiver")
+    return _convert_NSMutableDictionary(obj)
+
+def _convert_NSMutableDictionary(obj):
+    # NSDictionaries in the values are converted here too, with a stack rather
+    # than by recursing, as archives can nest them thousands of levels deep. 
+    # The result (and the errors that are logged or raised) is the same as 
+    # converting each value with NSKeyedArchiver_convert().
+    result = {}
+    stack = [_NSMutableDictionary_frame(obj, result, None, None, None, None)]
+    on_path = None # ids of the archived dicts being converted, once there is a nested one
+    while stack:
+        container, items, vals, parent, parent_key, archived_id, finish = stack[-1]
+        original = None
+        if isinstance(vals, NsKeyedArchiverList):
+            original, object_table = vals.original, vals.object_table
+            table_size = len(object_table)
+        child_frame = None
+        try:
+            for i, k in items:
+                try:
+                    if k in container:
+                        raise ValueError("The 'NS.keys' list contains duplicate entries")
+                    if original is None:
+                        container[k] = vals[i]
+                        continue
+                    value = target = original[i]
+                    if isinstance(value, BplistUID) and value.value < table_size:
+                        target = object_table[value.value]
+                    nested = None
+                    if isinstance(target, dict) and "NS.keys" in target:
+                        nested = _nested_NSMutableDictionary(value, target, object_table)
+                    if nested is None:
+                        container[k] = NSKeyedArchiver_convert(value, object_table)
+                        continue
+                    if on_path is None:
+                        on_path = {id(getattr(obj, "original", obj))}
+                    if id(target) in on_path:
+                        raise RecursionError("NSDictionary contains itself")
+                    child = {}
+                    child_frame = _NSMutableDictionary_frame(nested[0], child, container, k, id(target), nested[1])
+                    container[k] = child
+                    break
+                except (ValueError, TypeError) as ex:
+                    # Sometimes k is a dict, just silently ignore the TypeError about not being able to hash..
+                    log.warning(ex)
+        except (ValueError, TypeError) as ex:
+            # Converting a key failed, as if converting this dictionary failed the parent leaves it out
+            if parent is None:
+                raise
+            log.warning(ex)
+            del parent[parent_key]
+            finish = None
+        if child_frame is not None:
+            stack.append(child_frame)
+            on_path.add(child_frame[5])
+            continue
+        stack.pop()
+        if on_path is not None:
+            on_path.discard(archived_id)
+        if finish is not None:
+            try:
+                converted = finish(container)
+                if converted is not container:
+                    parent[parent_key] = converted
+            except (ValueError, TypeError) as ex:
+                log.warning(ex)
+                del parent[parent_key]
+    return result
+
+def _NSMutableDictionary_frame(obj, container, parent, parent_key, archived_id, finish):
+    """Checks the keys and values of obj, returns the frame _convert_NSMutableDictionary() 
+    converts obj's items into container with: (container, iterator of (index, key), vals,
+    parent dict, key in parent, id of the archived dict, converter to apply when done or None)"""
     keys = obj["NS.keys"]
     vals = obj["NS.objects"]
 
     # sense check the keys and values:
-    if not isinstance(keys, list):
+    if not isinstance(keys, (list, NsKeyedArchiverList)):
         raise TypeError("The 'NS.keys' value is an unexpected type (expected list; actual: {0}".format(type(keys)))
-    if not isinstance(vals, list):
+    if not isinstance(vals, (list, NsKeyedArchiverList)):
         raise TypeError("The 'NS.objects' value is an unexpected type (expected list; actual: {0}".format(type(vals)))
     if len(keys) != len(vals):
         raise ValueError("The length of the 'NS.keys' list ({0}) is not equal to that of the 'NS.objects ({1})".format(len(keys), len(vals)))
-
-    result = {}
-    for i,k in enumerate(keys):
-        try:
-            if k in result:
-                raise ValueError("The 'NS.keys' list contains duplicate entries")
-            result[k] = vals[i]
-        except (ValueError, TypeError) as ex:
-            # Sometimes k is a dict, just silently ignore the TypeError about not being able to hash..
-            print (ex)
-    return result
+    return (container, enumerate(keys), vals, parent, parent_key, archived_id, finish)
+
+def _nested_NSMutableDictionary(value, archived, object_table):
+    """If NSKeyedArchiver_convert(value, object_table) would call _convert_NSMutableDictionary()
+    on archived (value or what its uid resolves to), returns (the object it would be called
+    with, converter to apply to the result or None), else None"""
+    converter = object_table.converter if isinstance(object_table, NsKeyedArchiverObjectTable) else _object_converter
+    if converter is not NSKeyedArchiver_common_objects_convertor:
+        return None
+    obj = NsKeyedArchiverDictionary(archived, object_table)
+    entry = _class_converters.get(get_classname(obj))
+    if entry is None or entry[1] is not _convert_NSMutableDictionary:
+        return None
+    for key in entry[0]:
+        if key not in obj:
+            return None
+    # NSKeyedArchiver_convert() applies the converter again to what a uid resolves to
+    return obj, converter if isinstance(value, BplistUID) else None
 
 # NSArray convenience functions
 def is_nsarray(obj):
-    if not isinstance(obj, dict):
+    if not isinstance(obj, collections.abc.Mapping):
         return False
     if "$class" not in obj.keys():
         return False
@@ -459,12 +767,14 @@ def is_nsarray(obj):
 def convert_NSArray(obj):
     if not is_nsarray(obj):
         raise ValueError("obj does not have the correct structure for a NSArray/NSMutableArray serialised to a NSKeyedArchiver")
+    return _convert_NSArray(obj)
 
+def _convert_NSArray(obj):
     return obj["NS.objects"]
 
 # NSSet convenience functions
 def is_isnsset(obj):
-    if not isinstance(obj, dict):
+    if not isinstance(obj, collections.abc.Mapping):
         return False
     if "$class" not in obj.keys():
         return False
@@ -478,12 +788,16 @@ def is_isnsset(obj):
 def convert_NSSet(obj):
     if not is_isnsset(obj):
         raise ValueError("obj does not have the correct structure for a NSSet/NSMutableSet serialised to a NSKeyedArchiver")
+    return _convert_NSSet(obj)
 
-    return list(obj["NS.objects"]) # set(obj["NS.objects"]) # Changed Set to List (YK)
+def _convert_NSSet(obj):
+    # Returned as a list (YK), the same view as for NSArray, so its items are only
+    # converted when read rather than all of them (recursively) here
+    return obj["NS.objects"] # set(obj["NS.objects"])
 
 # NSString convenience functions
 def is_nsstring(obj):
-    if not isinstance(obj, dict):
+    if not isinstance(obj, collections.abc.Mapping):
         return False
     if "$class" not in obj.keys():
         return False
@@ -496,12 +810,14 @@ def is_nsstring(obj):
 def convert_NSString(obj):
     if not is_nsstring(obj):
         raise ValueError("obj does not have the correct structure for a NSString/NSMutableString serialised to a NSKeyedArchiver")
+    return _convert_NSString(obj)
 
+def _convert_NSString(obj):
     return obj["NS.string"]
 
 # NSDate convenience functions
 def is_nsdate(obj):
-    if not isinstance(obj, dict):
+    if not isinstance(obj, collections.abc.Mapping):
         return False
     if "$class" not in obj.keys():
         return False
@@ -515,17 +831,20 @@ def is_nsdate(obj):
 def convert_NSDate(obj):
     if not is_nsdate(obj):
         raise ValueError("obj does not have the correct structure for a NSDate serialised to a NSKeyedArchiver")
+    return _convert_NSDate(obj)
+
+def _convert_NSDate(obj):
     try:
         if obj["NS.time"] == -63114076800.0:
             return None
         return datetime.datetime(2001, 1, 1) + datetime.timedelta(seconds=obj["NS.time"])
     except (OverflowError, ValueError) as ex:
-        print(ex, obj["NS.time"])
+        log.warning("%s %s", ex, obj["NS.time"])
         return None
 
 # NSUUID convenience functions
 def is_nsuuid(obj):
-    if not isinstance(obj, dict):
+    if not isinstance(obj, collections.abc.Mapping):
         return False
     if "$class" not in obj.keys():
         return False
@@ -539,9 +858,19 @@ def is_nsuuid(obj):
 def convert_NSUUID(obj):
     if not is_nsuuid(obj):
         raise ValueError("obj does not have the correct structure for a NSUUID serialised to a NSKeyedArchiver")
+    return _convert_NSUUID(obj)
+
+def _convert_NSUUID(obj):
     try:
         uuid = UUID(bytes=obj["NS.uuidbytes"])
         return str(uuid).upper()
     except (TypeError, ValueError) as ex:
-        print(ex, obj["NS.uuidbytes"])
+        log.warning("%s %s", ex, obj["NS.uuidbytes"])
         return None
+
+register_class_converter(("NSMutableDictionary", "NSDictionary"), _convert_NSMutableDictionary, ("NS.keys", "NS.objects"))
+register_class_converter(("NSArray", "NSMutableArray"), _convert_NSArray, ("NS.objects",))
+register_class_converter(("NSSet", "NSMutableSet"), _convert_NSSet, ("NS.objects",))
+register_class_converter(("NSString", "NSMutableString"), _convert_NSString, ("NS.string",))
+register_class_converter("NSDate", _convert_NSDate, ("NS.time",))
+register_class_converter("NSUUID", _convert_NSUUID, ("NS.uuidbytes",))
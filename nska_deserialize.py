@@ -14,8 +14,6 @@ with open(input_path, 'rb') as f:
     try:
         deserialized_plist = nd.deserialize_plist(f, True, format=dict) # Get Deserialized plist
     except (nd.DeserializeError, 
-            nd.biplist.NotBinaryPlistException, 
-            nd.biplist.InvalidPlistException,
             nd.plistlib.InvalidFileException,
             nd.ccl_bplist.BplistError, 
             ValueError, 
@@ -34,18 +32,43 @@ with open(input_path, 'rb') as f:
 
 """
 
-import biplist
+import argparse
+import asyncio
+import binascii
 import ccl_bplist
+import codecs
+import collections
+import collections.abc
+import datetime
+import functools
+import hashlib
+import importlib
+import inspect
 import io
+import itertools
 import json
+import multiprocessing
+import multiprocessing.util
+import os
+import pickle
 import plistlib
 import re
+import sqlite3
+import stat
 import sys
+import threading
+import time
+import xml.parsers.expat
 
-deserializer_version = '1.5.1'
+try:
+    import orjson # optional, faster json encoding
+except ImportError:
+    orjson = None
 
-rec_depth = 0
-rec_uids = []
+deserializer_version = '1.6.0'
+
+_cfuid_pattern = re.compile(rb'CF\$UID')
+_archiver_pattern = re.compile(rb'\$archiver')
 
 class DeserializeError(Exception):
     pass
@@ -54,116 +77,171 @@ def get_version():
     global deserializer_version
     return deserializer_version
 
-def _recurse_safely(uid, plist, root, object_table):
-    '''Returns False if infinite recursion was detected'''
-    global rec_uids
-    if uid in rec_uids:
-        #print(f'INFINITE RECURSION detected - breaking loop! uid={uid} , LIST={str(rec_uids)}')
-        return False
-    rec_uids.append(uid)
-    _recurse_create_plist(plist, root, object_table)
-    rec_uids.pop()
-    return True
-
-def _recurse_create_plist(plist, root, object_table):
-    global rec_depth
-    rec_depth += 1
-    
-    #if rec_depth > 50:
-    #    print('Possible infinite recursion detected!!')
-    if isinstance(root, dict):
-        for key, value in root.items():
-            if key == '$class': 
-                continue
-            add_this_item = True
-            v = None
-            if isinstance(value, ccl_bplist.BplistUID):
-                v2 = ccl_bplist.NSKeyedArchiver_convert(object_table[value.value], object_table)
-                if isinstance(v2, dict):
-                    v = {}
-                    add_this_item = _recurse_safely(value.value, v, v2, object_table)
-                elif isinstance(v2, list):
-                    v = []
-                    add_this_item = _recurse_safely(value.value, v, v2, object_table)
+class _ArchiveContext:
+    '''State used while deserializing a single NSKeyedArchive: its object table
+       (which carries the object converter), the uids of the objects currently 
+       being processed (for loop detection) and caches of converted objects and
+       built subtrees, keyed by uid. Each archive gets its own context, nothing
+       is shared between deserializations.
+    '''
+    def __init__(self, object_table, share_objects=False):
+        self.object_table = object_table
+        self.share_objects = share_objects
+        self.rec_uids = set()
+        self.converted = {} # uid -> result of NSKeyedArchiver_convert
+        self.built = {}     # uid -> fully built dict/list, only for subtrees where no loop was broken
+        self.loops_broken = 0
+
+    def convert(self, uid):
+        '''Returns the converted object for uid, each uid is only converted once'''
+        try:
+            return self.converted[uid]
+        except KeyError:
+            v = ccl_bplist.NSKeyedArchiver_convert(self.object_table[uid], self.object_table)
+            self.converted[uid] = v
+            return v
+
+def _copy_plist(plist):
+    '''Returns a copy of a built plist, dicts and lists are copied, other values are shared'''
+    copy = {} if isinstance(plist, dict) else []
+    stack = [(plist, copy)]
+    while stack:
+        source, target = stack.pop()
+        if isinstance(source, dict):
+            for k, v in source.items():
+                if isinstance(v, (dict, list)):
+                    target[k] = {} if isinstance(v, dict) else []
+                    stack.append((v, target[k]))
                 else:
-                    v = v2
-            elif isinstance(value, list):
-                v = []
-                _recurse_create_plist(v, value, object_table)
-            elif isinstance(value, dict):
-                v = {}
-                _recurse_create_plist(v, value, object_table)
+                    target[k] = v
+        else:
+            for v in source:
+                if isinstance(v, (dict, list)):
+                    target.append({} if isinstance(v, dict) else [])
+                    stack.append((v, target[-1]))
+                else:
+                    target.append(v)
+    return copy
+
+_max_nesting_depth = 100000
+
+# Containers as read from an archive, ccl_bplist's wrappers are views (not dict/list subclasses)
+_archive_dict_types = (dict, ccl_bplist.NsKeyedArchiverDictionary)
+_archive_container_types = (dict, list, ccl_bplist.NsKeyedArchiverDictionary, ccl_bplist.NsKeyedArchiverList)
+
+def _archive_items(container):
+    '''Returns an iterator over the (key, value) items of an archived dict or the
+       items of a list, with references left as uids. Iterating an
+       NsKeyedArchiverList would convert its items, and hide their uids from
+       loop detection.'''
+    if isinstance(container, _archive_dict_types):
+        return iter(container.items())
+    if isinstance(container, ccl_bplist.NsKeyedArchiverList):
+        return iter(container.original)
+    return iter(container)
+
+def _recurse_create_plist(plist, root, context):
+    '''Fills plist (an empty dict or list) with the deserialized contents of root.
+       Nested objects are processed with an explicit stack rather than by recursion,
+       so deeply nested archives do not hit the recursion limit. An object (uid)
+       that is already being processed higher up in the tree is not added again,
+       this breaks the infinite loops that some archives contain.
+       An object referenced several times is only converted and built once, 
+       later references get a copy (or the same object if context.share_objects).
+       A subtree in which a loop was broken is not reused, as its contents depend
+       on where it was reached from.
+       All traversal state is in the archive's context, so this is re-entrant 
+       and safe to run from several threads at once.
+    '''
+    # uids of the objects on the stack, for constant time loop detection
+    rec_uids = context.rec_uids
+    built = context.built
+    # Frames of (plist being filled, iterator over items of its root, uid or None, 
+    #            loops_broken when the frame was started)
+    stack = [(plist, _archive_items(root), None, 0)]
+    while stack:
+        plist, items, uid, loops_broken = stack[-1]
+        is_dict = isinstance(plist, dict)
+        for item in items:
+            if is_dict:
+                key, value = item
+                if key == '$class': 
+                    continue
+                # Keys must be string, else plist writing will fail!
+                if not isinstance(key, str):
+                    key = str(key)
             else:
-                v = value
-            # change None to empty string. This is because if an object value is $null, it
-            # is most likely going to be a string. This has to be done, else writing a plist back will fail.
-            if v == None:
-                v = ''
-            # Keys must be string, else plist writing will fail!
-            if not isinstance(key, str):
-                key = str(key)
-            if add_this_item:
-                plist[key] = v
-    else: # must be list
-        for value in root:
-            v = None
-            add_this_item = True
+                value = item
+            new_frame = None
             if isinstance(value, ccl_bplist.BplistUID):
-                v2 = ccl_bplist.NSKeyedArchiver_convert(object_table[value.value], object_table)
-                if isinstance(v2, dict):
-                    v = {}
-                    add_this_item = _recurse_safely(value.value, v, v2, object_table)
-                elif isinstance(v2, list):
-                    v = []
-                    add_this_item = _recurse_safely(value.value, v, v2, object_table)
+                v2 = context.convert(value.value)
+                if isinstance(v2, _archive_container_types):
+                    if value.value in rec_uids:
+                        #print(f'INFINITE RECURSION detected - breaking loop! uid={value.value} , SET={str(rec_uids)}')
+                        context.loops_broken += 1
+                        continue
+                    v = built.get(value.value)
+                    if v is not None:
+                        if not context.share_objects:
+                            v = _copy_plist(v)
+                    else:
+                        v = {} if isinstance(v2, _archive_dict_types) else []
+                        new_frame = (v, _archive_items(v2), value.value, context.loops_broken)
                 else:
                     v = v2
-            elif isinstance(value, list):
-                v = []
-                _recurse_create_plist(v, value, object_table)
-            elif isinstance(value, dict):
-                v = {}
-                _recurse_create_plist(v, value, object_table)
+            elif isinstance(value, _archive_container_types):
+                v = {} if isinstance(value, _archive_dict_types) else []
+                new_frame = (v, _archive_items(value), None, 0)
             else:
                 v = value
             # change None to empty string. This is because if an object value is $null, it
             # is most likely going to be a string. This has to be done, else writing a plist back will fail.
-            if v == None:
+            if v is None:
                 v = ''
-            if add_this_item:
+            if is_dict:
+                plist[key] = v
+            else:
                 plist.append(v)
-    rec_depth -= 1
-    
-def _convert_CFUID_to_UID(plist, use_plistlib=False):
+            if new_frame is not None:
+                # Process the nested object now, the rest of this one is resumed after it
+                if len(stack) >= _max_nesting_depth:
+                    raise DeserializeError('Objects nested more than {} levels deep, archive is probably looping'.format(_max_nesting_depth))
+                if new_frame[2] is not None:
+                    rec_uids.add(new_frame[2])
+                stack.append(new_frame)
+                break
+        else:
+            stack.pop()
+            if uid is not None:
+                rec_uids.discard(uid)
+                if context.loops_broken == loops_broken:
+                    built[uid] = plist
+
+def _convert_CFUID_to_UID(plist, uid_class):
     ''' For converting XML plists to binary, UIDs which are represented
-        as strings 'CF$UID' must be translated to actual UIDs.
+        as strings 'CF$UID' must be translated to actual UIDs. The UIDs are
+        created with uid_class, ie, plistlib.UID or ccl_bplist.BplistUID.
     '''
     if isinstance(plist, dict):
         for k, v in plist.items():
             if isinstance(v, dict):
                 num = v.get('CF$UID', None)
                 if (num is None) or (not isinstance(num, int)):
-                    _convert_CFUID_to_UID(v, use_plistlib)
+                    _convert_CFUID_to_UID(v, uid_class)
                 else:
-                    if use_plistlib:
-                        plist[k] = plistlib.UID(num)
-                    else:
-                        plist[k] = biplist.Uid(num)
+                    plist[k] = uid_class(num)
             elif isinstance(v, list):
-                _convert_CFUID_to_UID(v, use_plistlib)
+                _convert_CFUID_to_UID(v, uid_class)
     else: # list
         for index, v in enumerate(plist):
             if isinstance(v, dict):
                 num = v.get('CF$UID', None)
                 if (num is None) or (not isinstance(num, int)):
-                    _convert_CFUID_to_UID(v, use_plistlib)
+                    _convert_CFUID_to_UID(v, uid_class)
                 else:
-                    if use_plistlib:
-                        plist[index] = plistlib.UID(num)
-                    else:
-                        plist[index] = biplist.Uid(num)
+                    plist[index] = uid_class(num)
             elif isinstance(v, list):
-                _convert_CFUID_to_UID(v, use_plistlib)
+                _convert_CFUID_to_UID(v, uid_class)
 
 def _get_root_element_names(plist_dict):
     ''' The top element is usually called "root", but sometimes it is not!
@@ -180,127 +258,364 @@ def _get_root_element_names(plist_dict):
 
     return roots
 
-def _replace_all_hex_int_with_int(xml_text):
-    r'''
-        Returns string replacing all instances of hex integers
-        in xml to their decimal equivalent 
-        like \<integer>0x55\</integer>
-        with \<integer>85\</integer>
-        
-        Exceptions: ValueError (for invalid int conversions)
-    '''
-    pattern = re.compile("<integer>0x[0-9a-fA-F]*</integer>")
-    search_from = 0
-    match = pattern.search(xml_text, search_from)
-    while match:
-        hex_int = xml_text[match.start() + 11:match.end()-10]
-        dec_int = str(int(hex_int, 16))
-        
-        xml_text = xml_text[:match.start() + 9] + dec_int + xml_text[match.end()-10:]
-        search_from = match.start() + 9 + len(dec_int) + 10
-        match = pattern.search(xml_text, search_from)
-    return xml_text
-
-def _read_plist_file(fp):
-    '''Reads a plist file via plistlib or biplist depending on py version, and returns plist object'''
-    if sys.version_info >= (3, 9):
-        plist = plistlib.load(fp)
-    else:
-        plist = biplist.readPlist(fp)
-    return plist
+_xml_date_pattern = re.compile(r"(\d\d\d\d)(?:-(\d\d)(?:-(\d\d)(?:T(\d\d)(?::(\d\d)(?::(\d\d))?)?)?)?)?Z", re.ASCII)
+
+_xml_plist_prefixes = (b'<?xml', b'<plist', codecs.BOM_UTF8, codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE, 
+                       codecs.BOM_UTF32_BE, codecs.BOM_UTF32_LE)
 
-def _verify_fix_plist_file(f):
-    '''Checks plist file. If invalid XML, tries to fix it.  
-       Returns a tuple (fixed_file, plist)
+class _XmlPlistParser:
+    '''Incremental Xml plist parser, built on expat like plistlib. The file is 
+       read and parsed in chunks, and objects are created as their elements
+       end, so only the plist objects are held in memory, not the file or its
+       text. Includes the fixups needed for plists that plistlib does 
+       not read: whitespace before the <?xml declaration (files edited by a 
+       non-Apple utility), invalid UTF-8, which is dropped, and hexadecimal 
+       integers (BigSur (11.0) plists).
+       Dicts with an integer CF$UID (other than the root) are created as 
+       ccl_bplist.BplistUID, as _convert_CFUID_to_UID() does.
     '''
-    try:
-        plist = _read_plist_file(f)
-    except (biplist.InvalidPlistException, plistlib.InvalidFileException) as ex:
-        # Assuming XML format that is badly formatted
-        # Perhaps this is manually edited or incorrectly formatted by a non-Apple utility  
-        # that has left whitespaces at the start of file before <?xml tag
-        # Or it's a bigSur (11.0) plist with hex integers
-        f.seek(0)
-        data = f.read().decode('utf8', 'ignore')
-        f.close()
-        data = _replace_all_hex_int_with_int(data) # Fix for BigSur plists with hex ints
-        data = data.lstrip(" \r\n\t").encode('utf8', 'ignore')
-        f = io.BytesIO(data)
-        # Now try reading again with biplist
-        plist = _read_plist_file(f)
-    return f, plist
+    chunk_size = 1024 * 1024
+
+    def __init__(self):
+        self.stack = [] # frames of (dict or list being filled, key to store it at in its parent)
+        self.current_key = None
+        self.root = None
+        self.data = []
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.handle_begin_element
+        self.parser.EndElementHandler = self.handle_end_element
+        self.parser.CharacterDataHandler = self.data.append
+        self.parser.EntityDeclHandler = self.handle_entity_decl
+        self.end_handlers = {
+            'dict': self.end_container, 'array': self.end_container, 'key': self.end_key,
+            'string': self.end_string, 'integer': self.end_integer, 'real': self.end_real,
+            'true': self.end_true, 'false': self.end_false, 'date': self.end_date, 
+            'data': self.end_data }
+
+    def parse(self, f):
+        '''Returns the root object of the Xml plist in file f (which must be 
+           seekable). If expat fails, eg: on invalid UTF-8, the file is parsed 
+           again with the invalid UTF-8 bytes dropped.
+           Exceptions: plistlib.InvalidFileException (not an Xml plist), 
+           xml.parsers.expat.ExpatError, ValueError
+        '''
+        start = f.tell()
+        try:
+            return self._parse(f)
+        except (xml.parsers.expat.ExpatError, UnicodeDecodeError):
+            f.seek(start)
+            return _XmlPlistParser()._parse(f, codecs.getincrementaldecoder('utf8')(errors='ignore'))
+
+    def _parse(self, f, decoder=None):
+        '''Parses f, with each chunk passed through decoder and back to UTF-8 if given'''
+        read = f.read
+        if decoder is not None:
+            def read(size):
+                data = f.read(size)
+                return decoder.decode(data, not data).encode('utf8')
+        chunk = read(self.chunk_size)
+        # Skip whitespace left at the start of file before <?xml tag
+        while chunk and not chunk.lstrip(b" \r\n\t"):
+            chunk = read(self.chunk_size)
+        chunk = chunk.lstrip(b" \r\n\t")
+        if not chunk.startswith(_xml_plist_prefixes):
+            raise plistlib.InvalidFileException()
+        parse = self.parser.Parse
+        while chunk:
+            parse(chunk, False)
+            chunk = read(self.chunk_size)
+        parse(b'', True)
+        return self.root
+
+    def handle_entity_decl(self, entity_name, is_parameter_entity, value, base, system_id, public_id, notation_name):
+        # Same as plistlib, entities are not allowed to avoid XML vulnerabilities in expat
+        raise plistlib.InvalidFileException("XML entity declarations are not supported in plist files")
+
+    def handle_begin_element(self, element, attrs):
+        self.data.clear()
+        if element == 'dict':
+            self.stack.append(({}, self.current_key))
+            self.current_key = None
+        elif element == 'array':
+            self.stack.append(([], self.current_key))
+            self.current_key = None
+
+    def handle_end_element(self, element):
+        handler = self.end_handlers.get(element)
+        if handler is not None:
+            handler()
+
+    def add_object(self, value):
+        if self.current_key is not None:
+            if not isinstance(self.stack[-1][0], dict):
+                raise ValueError("unexpected element at line %d" % self.parser.CurrentLineNumber)
+            self.stack[-1][0][self.current_key] = value
+            self.current_key = None
+        elif not self.stack:
+            # this is the root object
+            self.root = value
+        else:
+            if not isinstance(self.stack[-1][0], list):
+                raise ValueError("unexpected element at line %d" % self.parser.CurrentLineNumber)
+            self.stack[-1][0].append(value)
+
+    def get_data(self):
+        data = ''.join(self.data)
+        self.data.clear()
+        return data
+
+    def end_container(self):
+        if self.current_key is not None:
+            raise ValueError("missing value for key '%s' at line %d" % (self.current_key, self.parser.CurrentLineNumber))
+        value, self.current_key = self.stack.pop()
+        if self.stack and isinstance(value, dict):
+            num = value.get('CF$UID', None)
+            if isinstance(num, int):
+                value = ccl_bplist.BplistUID(num)
+        self.add_object(value)
+
+    def end_key(self):
+        if self.current_key is not None or not self.stack or not isinstance(self.stack[-1][0], dict):
+            raise ValueError("unexpected key at line %d" % self.parser.CurrentLineNumber)
+        self.current_key = self.get_data()
+
+    def end_string(self):
+        self.add_object(self.get_data())
+
+    def end_integer(self):
+        raw = self.get_data()
+        if raw.startswith('0x') or raw.startswith('0X'):
+            self.add_object(int(raw, 16))
+        else:
+            self.add_object(int(raw))
+
+    def end_real(self):
+        self.add_object(float(self.get_data()))
+
+    def end_true(self):
+        self.add_object(True)
+
+    def end_false(self):
+        self.add_object(False)
+
+    def end_date(self):
+        match = _xml_date_pattern.match(self.get_data())
+        if match is None:
+            raise ValueError("invalid date at line %d" % self.parser.CurrentLineNumber)
+        parts = []
+        for part in match.groups():
+            if part is None:
+                break
+            parts.append(int(part))
+        self.add_object(datetime.datetime(*parts))
+
+    def end_data(self):
+        self.add_object(binascii.a2b_base64(self.get_data().encode('utf-8')))
 
 def _get_valid_nska_plist(f):
     '''Checks if there is an embedded NSKeyedArchiver plist as a data blob. On 
-       ios, several files are like that. Also converts any xml based plist to 
-       binary plist. Returns a file object representing a binary plist file and
-       a plist object packaged as a tuple (file_obj, plist).
+       ios, several files are like that. Returns the plist object parsed by 
+       ccl_bplist, ie, with UIDs as ccl_bplist.BplistUID. Plists are only 
+       parsed once, this same object is used for the $archiver check and
+       the deserialization. Xml plists are not converted to binary, they
+       are parsed straight to the objects ccl_bplist would return.
     '''
-    f, plist = _verify_fix_plist_file(f)
-    if isinstance(plist, bytes): # If there is an embedded plist
-        data = plist
-        f = io.BytesIO(data)
-        f, plist = _verify_fix_plist_file(f)
-    f.seek(0)
-
-    # Check if file to be returned is an XML plist
-    file_content = f.read()
+    header = f.read(8)
     f.seek(0)
-    if file_content[0:6] != b'bplist' or file_content.find(b'CF$UID') >= 0: 
-        # must be xml or has CF$UID
-        # 1. Xml must be converted to binary (else ccl_bplist wont load!)
-        # 2. CF$UID must be changed to UID for ccl_bplist
-        tempfile = io.BytesIO()
-        if sys.version_info >= (3, 9):
-            _convert_CFUID_to_UID(plist, True)
-            plistlib.dump(plist, tempfile, fmt=plistlib.FMT_BINARY)
-        else:
-            _convert_CFUID_to_UID(plist, False)
-            biplist.writePlist(plist, tempfile)
-        tempfile.seek(0)
-        return tempfile, plist
+    if header == b'bplist00':
+        # Decoded straight from a memoryview (mmap for real files), no copies of the file are made
+        with ccl_bplist.open_buffer(f) as buf:
+            plist = ccl_bplist.loads(buf)
+            has_cfuid = _cfuid_pattern.search(buf) is not None
+        if has_cfuid:
+            # CF$UID must be changed to UID, this is done in place
+            _convert_CFUID_to_UID(plist, ccl_bplist.BplistUID)
+    else:
+        # Xml is parsed incrementally into the same types as ccl_bplist returns,
+        # with CF$UID changed to UID as it is parsed
+        plist = _XmlPlistParser().parse(f)
 
-    return f, plist
+    if isinstance(plist, bytes): # If there is an embedded plist
+        return _get_valid_nska_plist(io.BytesIO(plist))
+    return plist
 
-def _unpack_top_level(f, plist_biplist_obj, full_recurse_convert_nska=False, format=list):
+def _unpack_top_level(plist, full_recurse_convert_nska, format, deserializer, lazy=False, key_path_states=True):
     '''Does the work to actually unpack the NSKeyedArchive's top level. Returns 
-    the top level object. 
+    the top level object. If lazy, dicts and lists are returned as lazy views.
+    key_path_states limit where nested NSKA are converted, see _advance_key_path_states().
     '''
-    ccl_bplist.set_object_converter(ccl_bplist.NSKeyedArchiver_common_objects_convertor)
-    ccl_plist = ccl_bplist.load(f)
-    if '$archiver' in plist_biplist_obj:
-        deserialised = _deserialize_nska(ccl_plist, plist_biplist_obj, format)
+    if '$archiver' in plist:
+        deserialised = _deserialize_nska(plist, format, deserializer, lazy, full_recurse_convert_nska, key_path_states)
         if full_recurse_convert_nska:
-            return _recurse_find_and_deserialize_nska(deserialised)
+            return _recurse_find_and_deserialize_nska(deserialised, deserializer, lazy, key_path_states)
         else:
             return deserialised
     elif full_recurse_convert_nska:
         # not an archiver at root, will attempt to deserialize anyway
-        plist = _recurse_find_and_deserialize_nska(plist_biplist_obj)
+        if lazy and isinstance(plist, (dict, list)):
+            return _lazy_view(plist, frozenset(), None, deserializer, key_path_states)
+        plist = _recurse_find_and_deserialize_nska(plist, deserializer, False, key_path_states)
         return plist
     else:
         # emulate old behaviour, do not process non-NSKA plist
         raise DeserializeError('No $archiver object found! Not a NSKeyedArchive.')
 
-def _recurse_find_and_deserialize_nska(plist):
-    '''Find and replace all instances of NSKA with deserialized plist branch'''
-    if isinstance(plist, dict):
-        for k, v in plist.items():
-            if isinstance(v, bytes) or isinstance(v, dict) or isinstance(v, list):
-                plist[k] = _recurse_find_and_deserialize_nska(v)
-    elif isinstance(plist, list):
-        for i, v in enumerate(plist):
-            if isinstance(v, bytes)or isinstance(v, dict) or isinstance(v, list):
-                plist[i] = _recurse_find_and_deserialize_nska(v)
-    elif isinstance(plist, bytes):
-        if plist[0:6] == b'bplist' or (plist.find(b'<?xml') >= 0 and plist.find(b'<plist version')>=0): 
-            plist = deserialize_plist_from_string(plist, True)
+def _compile_key_paths(key_paths):
+    '''Returns the initial key path match states for key_paths (see 
+       _advance_key_path_states()), True if key_paths is None'''
+    if key_paths is None:
+        return True
+    if isinstance(key_paths, str):
+        key_paths = [key_paths]
+    states = []
+    for key_path in key_paths:
+        steps = tuple(_compile_path(key_path))
+        if any(kind == 'index' and arg < 0 for kind, arg in steps):
+            raise ValueError('Negative list index in key path {!r}'.format(key_path))
+        states.append((steps, 0, 0))
+    return tuple(states)
+
+def _advance_key_path_states(states, key):
+    '''Key paths (the same as paths for extract(), with '*' also matching any
+       key) are matched as a plist is walked, with states that are True (the 
+       path walked so far is, or is under, one of the key paths), or a tuple of
+       (steps of a key path, step index, index of key part in the step) for the
+       key paths it could still reach. Returns the states after walking into key
+       (a dict key, or a list index). An empty tuple means no key path can match.
+    '''
+    if states is True:
+        return True
+    new_states = []
+    for steps, step, part in states:
+        kind, arg = steps[step]
+        if kind == 'keys':
+            if not isinstance(key, str):
+                continue
+            if arg[part] == '*':
+                ends = (part + 1,)
+            else:
+                ends = [end for end in range(part + 1, len(arg) + 1) if '.'.join(arg[part:end]) == key]
+            for end in ends:
+                if end < len(arg):
+                    new_states.append((steps, step, end))
+                elif step + 1 == len(steps):
+                    return True
+                else:
+                    new_states.append((steps, step + 1, 0))
+        elif isinstance(key, int) and (kind == 'all' or arg == key):
+            if step + 1 == len(steps):
+                return True
+            new_states.append((steps, step + 1, 0))
+    return tuple(new_states)
+
+def _looks_like_plist(data):
+    '''Checks only the start of data for a binary or xml plist header'''
+    if data[0:6] == b'bplist':
+        return True
+    header = data[:1024].lstrip(b" \r\n\t")
+    if header.startswith(b'<?xml'):
+        return b'<plist' in header
+    if header.startswith(b'<plist'):
+        return True
+    for bom, encoding in _xml_boms:
+        if header.startswith(bom):
+            return header[len(bom):].startswith(('<?xml'.encode(encoding), '<plist'.encode(encoding)))
+    return False
+
+_xml_boms = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_BE, 'utf-16-be'), (codecs.BOM_UTF16_LE, 'utf-16-le'),
+             (codecs.BOM_UTF32_BE, 'utf-32-be'), (codecs.BOM_UTF32_LE, 'utf-32-le'))
+
+def _nested_blob_wanted(data, deserializer):
+    '''Returns True if data looks like a plist and passes the deserializer's nested_* checks'''
+    size = len(data)
+    if size < deserializer.nested_min_size or (deserializer.nested_max_size is not None and size > deserializer.nested_max_size):
+        reason = 'skipped_size'
+    elif not _looks_like_plist(data):
+        reason = 'not_plist'
+    elif deserializer.nested_archivers_only and _archiver_pattern.search(data) is None:
+        reason = 'no_archiver'
+    else:
+        reason = None
+    deserializer._count_nested(reason)
+    return reason is None
+
+def _deserialize_nested_nska(data, deserializer, lazy=False):
+    '''Returns the deserialized plist if data is a plist (and passes the 
+       deserializer's nested_* checks), else data unchanged'''
+    if not _nested_blob_wanted(data, deserializer):
+        return data
+    result = deserializer._deserialize_string(data, True, list, lazy, True)
+    deserializer._count_nested_converted()
+    return result
+
+_nested_worker_thread = threading.local() # .active is True while a thread runs _deserialize_nested_blob()
+
+def _deserialize_nested_blob(deserializer, data):
+    '''Deserializes a nested blob (already checked) in a nested_executor worker. 
+       Blobs nested in it are deserialized in this worker, not sent to the 
+       executor again, which could deadlock a thread pool.'''
+    _nested_worker_thread.active = True
+    try:
+        return deserializer._deserialize_string(data, True, list, False, True)
+    finally:
+        _nested_worker_thread.active = False
+
+def _recurse_find_and_deserialize_nska(plist, deserializer, lazy=False, key_path_states=True):
+    '''Find and replace all instances of NSKA with deserialized plist branch.
+       Walks the plist with an explicit stack, so deeply nested plists do not
+       hit the recursion limit. Lazy views are not walked, they convert 
+       nested NSKA themselves when accessed. Only blobs at key_path_states 
+       (see _advance_key_path_states()) are converted. If the deserializer has
+       a nested_executor, all the blobs are found first, then deserialized 
+       concurrently with it and put in place.
+    '''
+    if isinstance(plist, bytes):
+        if key_path_states is True:
+            return _deserialize_nested_nska(plist, deserializer, lazy)
+        return plist
+    if not isinstance(plist, (dict, list)):
+        return plist
+    executor = deserializer.nested_executor
+    if lazy or getattr(_nested_worker_thread, 'active', False):
+        executor = None
+    pending = [] # (container, key or index, blob) to deserialize with the executor
+    # Frames of (container, iterator over its (key or index, value) pairs, key path states)
+    stack = [(plist, iter(plist.items()) if isinstance(plist, dict) else enumerate(plist), key_path_states)]
+    while stack:
+        container, items, states = stack[-1]
+        for k, v in items:
+            if isinstance(v, (bytes, dict, list)):
+                child_states = states if states is True else _advance_key_path_states(states, k)
+                if not child_states:
+                    continue # not on any of the key paths
+                if isinstance(v, bytes) and child_states is True:
+                    if executor is None:
+                        container[k] = _deserialize_nested_nska(v, deserializer, lazy)
+                    elif _nested_blob_wanted(v, deserializer):
+                        pending.append((container, k, v))
+                elif not isinstance(v, bytes): # bytes not at the end of a key path are left as is
+                    stack.append((v, iter(v.items()) if isinstance(v, dict) else enumerate(v), child_states))
+                    break
+        else:
+            stack.pop()
+    if len(pending) == 1:
+        container, k, v = pending[0]
+        container[k] = deserializer._deserialize_string(v, True, list, False, True)
+        deserializer._count_nested_converted()
+    elif pending:
+        results = executor.map(functools.partial(_deserialize_nested_blob, deserializer), [v for _, _, v in pending])
+        for (container, k, _), result in zip(pending, results):
+            container[k] = result
+            deserializer._count_nested_converted()
     return plist
 
-def _deserialize_nska(ccl_plist, plist_biplist_obj, format=list):
-    ns_keyed_archiver_obj = ccl_bplist.deserialise_NsKeyedArchiver(ccl_plist, parse_whole_structure=True)
+def _deserialize_nska(plist, format, deserializer, lazy=False, full_recurse_convert_nska=False, key_path_states=True):
+    ns_keyed_archiver_obj = ccl_bplist.deserialise_NsKeyedArchiver(plist, parse_whole_structure=True, 
+                                                                   converter=deserializer.object_converter)
+    context = _ArchiveContext(ns_keyed_archiver_obj.object_table, deserializer.share_objects)
 
-    root_names = _get_root_element_names(plist_biplist_obj)
+    root_names = _get_root_element_names(plist)
     if format == dict:
         top_level = {}
     else:
@@ -310,14 +625,24 @@ def _deserialize_nska(ccl_plist, plist_biplist_obj, format=list):
         root = ns_keyed_archiver_obj[root_name]
         if root is None:
             root = ''
-        if isinstance(root, dict):
+        if lazy and isinstance(root, _archive_container_types):
+            # key path states of where this root will be in top_level
+            states = key_path_states
+            if len(root_names) > 1:
+                states = _advance_key_path_states(states, root_name if format == dict else len(top_level))
+            if root_name.lower() != 'root' and format != dict:
+                states = _advance_key_path_states(states, root_name)
+            plist = _lazy_view(root, frozenset(), context, deserializer if full_recurse_convert_nska else None, states)
+            if root_name.lower() != 'root' and format != dict:
+                plist = { root_name : plist }
+        elif isinstance(root, _archive_dict_types):
             plist = {}
-            _recurse_create_plist(plist, root, ns_keyed_archiver_obj.object_table)
+            _recurse_create_plist(plist, root, context)
             if root_name.lower() != 'root' and format != dict:
                 plist = { root_name : plist }
-        elif isinstance(root, list):
+        elif isinstance(root, (list, ccl_bplist.NsKeyedArchiverList)):
             plist = []
-            _recurse_create_plist(plist, root, ns_keyed_archiver_obj.object_table)
+            _recurse_create_plist(plist, root, context)
             if root_name.lower() != 'root' and format != dict:
                 plist = { root_name : plist }
         else:
@@ -336,6 +661,902 @@ def _deserialize_nska(ccl_plist, plist_biplist_obj, format=list):
 
     return top_level
 
+_skipped = object()
+
+class _LazyContainer:
+    '''Common parts of NskaLazyDict and NskaLazyList. source is the container
+       as the eager deserialization would iterate it, ancestors the uids of the
+       objects above it (as in _ArchiveContext.rec_uids), context the archive's
+       _ArchiveContext (None for a plist that is not an NSKA) and deserializer
+       the Deserializer for nested NSKA blobs (None if those are left as is),
+       which are only converted where key_path_states allow.
+    '''
+    def __init__(self, source, ancestors, context, deserializer, key_path_states=True):
+        self._source = source
+        self._ancestors = ancestors
+        self._context = context
+        self._deserializer = deserializer
+        self._key_path_states = key_path_states
+
+    def _resolve(self, value, key):
+        '''Returns what the eager deserialization stores for value (at key or index
+           key), with dicts and lists as lazy views, or _skipped if it is left out 
+           to break a loop'''
+        context = self._context
+        ancestors = self._ancestors
+        if context is not None:
+            if isinstance(value, ccl_bplist.BplistUID):
+                uid = value.value
+                value = context.convert(uid)
+                if isinstance(value, _archive_container_types):
+                    if uid in ancestors:
+                        return _skipped
+                    return _lazy_view(value, ancestors | {uid}, context, self._deserializer, self._child_states(key))
+            if value is None:
+                value = ''
+        if isinstance(value, _archive_container_types):
+            return _lazy_view(value, ancestors, context, self._deserializer, self._child_states(key))
+        if isinstance(value, bytes) and self._deserializer is not None and self._child_states(key) is True:
+            return _deserialize_nested_nska(value, self._deserializer, True)
+        return value
+
+    def _child_states(self, key):
+        if self._deserializer is None:
+            return True
+        return _advance_key_path_states(self._key_path_states, key)
+
+    def to_plist(self):
+        '''Returns the fully deserialized dict/list, same as the eager functions return'''
+        return materialize_plist(self)
+
+    def __repr__(self):
+        return repr(self.to_plist())
+
+class NskaLazyDict(_LazyContainer, collections.abc.Mapping):
+    '''Read only dict view of a deserialized NSKA dictionary. A key's value is
+       only deserialized when it is first accessed, and then cached. Nested
+       dicts/lists are returned as lazy views as well.
+    '''
+    def __init__(self, source, ancestors, context, deserializer, key_path_states=True):
+        super().__init__(source, ancestors, context, deserializer, key_path_states)
+        self._values = {}       # key -> resolved value, for the keys accessed so far
+        self._complete = False  # True once all keys are in _values, in order
+        self._str_keys = None   # True if all keys of source are strings
+
+    def _resolve_all(self):
+        if not self._complete:
+            values = {}
+            is_nska = self._context is not None
+            for key, value in dict.items(self._source):
+                if is_nska:
+                    if key == '$class':
+                        continue
+                    # Keys must be string, same as _recurse_create_plist
+                    if not isinstance(key, str):
+                        key = str(key)
+                v = self._values[key] if key in self._values else self._resolve(value, key)
+                if v is not _skipped:
+                    values[key] = v
+            self._values = values
+            self._complete = True
+        return self._values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            if self._complete:
+                raise
+        if self._context is not None:
+            if self._str_keys is None:
+                self._str_keys = all(isinstance(k, str) for k in dict.keys(self._source))
+            if not self._str_keys:
+                # keys are renamed by str(), resolve them all to get the same result
+                return self._resolve_all()[key]
+            if key == '$class':
+                raise KeyError(key)
+        try:
+            value = dict.__getitem__(self._source, key)
+        except (KeyError, TypeError):
+            raise KeyError(key) from None
+        v = self._resolve(value, key)
+        if v is _skipped:
+            raise KeyError(key)
+        self._values[key] = v
+        return v
+
+    def __iter__(self):
+        return iter(self._resolve_all())
+
+    def __len__(self):
+        return len(self._resolve_all())
+
+class NskaLazyList(_LazyContainer, collections.abc.Sequence):
+    '''Read only list view of a deserialized NSKA array. An item is only 
+       deserialized when it is first accessed, and then cached. Nested 
+       dicts/lists are returned as lazy views as well.
+    '''
+    def __init__(self, source, ancestors, context, deserializer, key_path_states=True):
+        super().__init__(source, ancestors, context, deserializer, key_path_states)
+        self._values = None     # all resolved items, once resolved
+        self._items = {}        # index -> resolved item, for items accessed before that
+        self._same_indexes = None
+
+    def _has_same_indexes(self):
+        '''True if no item of source can be left out to break a loop, so items
+           can be resolved by index. Only uids of the ancestors are left out.'''
+        if self._same_indexes is None:
+            ancestors = self._ancestors
+            self._same_indexes = (self._context is None or not ancestors or
+                                  not any(isinstance(v, ccl_bplist.BplistUID) and v.value in ancestors for v in self._source))
+        return self._same_indexes
+
+    def _resolve_all(self):
+        if self._values is None:
+            values = []
+            items = self._items
+            for index, value in enumerate(self._source):
+                v = items[index] if index in items else self._resolve(value, index)
+                if v is not _skipped:
+                    values.append(v)
+            self._values = values
+        return self._values
+
+    def __getitem__(self, index):
+        if self._values is None and isinstance(index, int) and self._has_same_indexes():
+            length = len(self._source)
+            if index < 0:
+                index += length
+            try:
+                return self._items[index]
+            except KeyError:
+                if not 0 <= index < length:
+                    raise IndexError('list index out of range') from None
+            v = self._resolve(self._source[index], index)
+            self._items[index] = v
+            return v
+        return self._resolve_all()[index]
+
+    def __len__(self):
+        if self._values is None and self._has_same_indexes():
+            return len(self._source)
+        return len(self._resolve_all())
+
+    def __iter__(self):
+        return iter(self._resolve_all())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, NskaLazyList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+def _lazy_view(source, ancestors, context, deserializer, key_path_states=True):
+    if isinstance(source, (ccl_bplist.NsKeyedArchiverDictionary, ccl_bplist.NsKeyedArchiverList)):
+        # The views read the stored values (uids) themselves, with the same loop checks as
+        # _recurse_create_plist, iterating the wrappers would convert them unchecked
+        source = source.original
+    if isinstance(source, dict):
+        return NskaLazyDict(source, ancestors, context, deserializer, key_path_states)
+    return NskaLazyList(source, ancestors, context, deserializer, key_path_states)
+
+def materialize_plist(plist):
+    '''
+        Returns plist with all lazy views (from deserialize_plist_lazy() or
+        deserialize_plist_from_string_lazy()) fully deserialized, ie, plain
+        dicts/lists exactly as deserialize_plist() would have returned them.
+        Plists without lazy views are returned as a copy.
+    '''
+    if not isinstance(plist, (dict, list, NskaLazyDict, NskaLazyList)):
+        return plist
+    copy = {} if isinstance(plist, (dict, NskaLazyDict)) else []
+    stack = [(plist, copy)]
+    while stack:
+        source, target = stack.pop()
+        is_dict = isinstance(target, dict)
+        for k, v in (source.items() if is_dict else enumerate(source)):
+            if isinstance(v, (dict, NskaLazyDict)):
+                c = {}
+                stack.append((v, c))
+            elif isinstance(v, (list, NskaLazyList)):
+                c = []
+                stack.append((v, c))
+            else:
+                c = v
+            if is_dict:
+                target[k] = c
+            else:
+                target.append(c)
+    return copy
+
+_path_token_pattern = re.compile(r'([^.\[\]]+)|\[(\*|-?\d+)\]|(\.)')
+
+def _compile_path(path):
+    '''Parses a path like 'root.NS.objects[*].URL' into a list of steps, which are
+       ('keys', parts) for a dotted run of keys, ('index', n) and ('all', None).
+       The parts of a key run are matched greedily, as keys may contain dots.
+    '''
+    steps = []
+    prev = None # previous token: None, 'key', 'index' or 'dot'
+    after_key_dot = False
+    pos = 0
+    while pos < len(path):
+        match = _path_token_pattern.match(path, pos)
+        if match is None:
+            raise ValueError('Invalid path {!r} at position {}'.format(path, pos))
+        key, index, dot = match.groups()
+        if key is not None:
+            if prev not in (None, 'dot'):
+                raise ValueError('Invalid path {!r} at position {}'.format(path, pos))
+            if after_key_dot:
+                steps[-1][1].append(key)
+            else:
+                steps.append(('keys', [key]))
+            prev = 'key'
+        elif index is not None:
+            if prev in (None, 'dot'):
+                raise ValueError('Invalid path {!r} at position {}'.format(path, pos))
+            steps.append(('all', None) if index == '*' else ('index', int(index)))
+            prev = 'index'
+        else:
+            if prev in (None, 'dot'):
+                raise ValueError('Invalid path {!r} at position {}'.format(path, pos))
+            after_key_dot = prev == 'key'
+            prev = 'dot'
+            pos = match.end()
+            continue
+        after_key_dot = False
+        pos = match.end()
+    if prev in (None, 'dot'):
+        raise ValueError('Invalid path {!r}'.format(path))
+    return [(kind, tuple(arg) if kind == 'keys' else arg) for kind, arg in steps]
+
+def _select(node, steps, start, default):
+    '''Returns the value at steps[start:] from node, or default if it is not there'''
+    for i in range(start, len(steps)):
+        kind, arg = steps[i]
+        if kind == 'keys':
+            parts = arg
+            j = 0
+            while j < len(parts):
+                if not isinstance(node, (dict, NskaLazyDict)):
+                    return default
+                for end in range(len(parts), j, -1):
+                    key = '.'.join(parts[j:end])
+                    if key in node:
+                        break
+                else:
+                    return default
+                node = node[key]
+                j = end
+        elif not isinstance(node, (list, NskaLazyList)):
+            return default
+        elif kind == 'all':
+            return [_select(item, steps, i + 1, default) for item in node]
+        else:
+            try:
+                node = node[arg]
+            except IndexError:
+                return default
+    return materialize_plist(node)
+
+class Selector:
+    '''
+        Compiled paths for extract(), create with compile_selector(). A Selector
+        holds no archive state, so it can be reused for any number of archives
+        and from several threads.
+    '''
+    def __init__(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.paths = tuple(paths)
+        self._steps = [_compile_path(path) for path in self.paths]
+
+    def extract(self, bytes_to_deserialize, default=None):
+        '''Same as nska_deserialize.extract() with this Selector'''
+        return _default_deserializer.extract(bytes_to_deserialize, self, default)
+
+    def __repr__(self):
+        return 'Selector({!r})'.format(list(self.paths))
+
+def compile_selector(paths):
+    '''
+        Returns a Selector for paths (a path or a list of paths), to use with
+        extract(). Compile once, when extracting the same paths from many archives.
+
+        Exceptions
+        ----------
+        ValueError (for an invalid path)
+    '''
+    return Selector(paths)
+
+def _import_optional(module_name, extra):
+    '''Imports an optional dependency, only needed by some functions'''
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError('{} is not installed, pip3 install nska_deserialize[{}]'.format(module_name, extra)) from None
+
+class ObjectsTable:
+    '''
+        The $objects table of an NSKeyedArchive, one row per object, from
+        get_objects_table(). Each attribute below is a column (a list), row
+        i is the object with uid i. Objects are not converted or linked up.
+
+        uids:       uid of the object (its index in $objects)
+        classnames: $classname of the object's $class, None for scalars and
+                    dicts without a $class (eg: the class definitions)
+        values:     value of a scalar object ($null is None), None for dicts
+        fields:     for dicts, the fields that are not references (without
+                    $class), None for scalars
+        refs:       for dicts, the fields that are references, as field name
+                    -> uid (or list of uids), None for scalars
+        top:        dict of $top name -> uid
+    '''
+    def __init__(self, classnames, values, fields, refs, top):
+        self.uids = list(range(len(classnames)))
+        self.classnames = classnames
+        self.values = values
+        self.fields = fields
+        self.refs = refs
+        self.top = top
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __iter__(self):
+        '''Rows as (uid, classname, value, fields, refs) tuples'''
+        return zip(self.uids, self.classnames, self.values, self.fields, self.refs)
+
+    def __getitem__(self, uid):
+        return (self.uids[uid], self.classnames[uid], self.values[uid], self.fields[uid], self.refs[uid])
+
+    def uids_of_class(self, classname):
+        '''Returns the uids of the objects whose $classname is classname'''
+        return [uid for uid, name in enumerate(self.classnames) if name == classname]
+
+    def to_numpy(self):
+        '''Returns the columns as a dict of numpy arrays (uid, classname, value, 
+           fields, refs), uid is int64 and the others are object arrays. 
+           Needs numpy.'''
+        np = _import_optional('numpy', 'numpy')
+        columns = {'uid': np.array(self.uids, dtype=np.int64)}
+        for name, column in (('classname', self.classnames), ('value', self.values),
+                             ('fields', self.fields), ('refs', self.refs)):
+            array = np.empty(len(column), dtype=object)
+            for i, value in enumerate(column): # not array[:] = column, that would unpack lists
+                array[i] = value
+            columns[name] = array
+        return columns
+
+    def to_arrow(self):
+        '''Returns the table as a pyarrow.Table. Scalar values are split by type
+           into the columns int_value, float_value, bool_value, str_value,
+           bytes_value and date_value (ints that do not fit in int64 and other
+           types are in str_value, as str()). fields is a map of string to string
+           (bytes in hex), refs a map of string to list of int64 uids, and $top
+           is in the schema metadata as json. Needs pyarrow.'''
+        pa = _import_optional('pyarrow', 'arrow')
+        count = len(self.uids)
+        typed = {name: [None] * count for name in 
+                 ('int_value', 'float_value', 'bool_value', 'str_value', 'bytes_value', 'date_value')}
+        for i, value in enumerate(self.values):
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                typed['bool_value'][i] = value
+            elif isinstance(value, int) and -2**63 <= value < 2**63:
+                typed['int_value'][i] = value
+            elif isinstance(value, float):
+                typed['float_value'][i] = value
+            elif isinstance(value, bytes):
+                typed['bytes_value'][i] = value
+            elif isinstance(value, datetime.datetime):
+                typed['date_value'][i] = value
+            else:
+                typed['str_value'][i] = str(value)
+        stringify = _stringify_scalar(True, 'hex')
+        fields = [None if f is None else [(str(k), stringify(v)) for k, v in f.items()] for f in self.fields]
+        refs = [None if r is None else [(str(k), v if isinstance(v, list) else [v]) for k, v in r.items()] for r in self.refs]
+        table = pa.table({
+            'uid': pa.array(self.uids, pa.int64()),
+            'classname': pa.array(self.classnames, pa.string()).dictionary_encode(),
+            'int_value': pa.array(typed['int_value'], pa.int64()),
+            'float_value': pa.array(typed['float_value'], pa.float64()),
+            'bool_value': pa.array(typed['bool_value'], pa.bool_()),
+            'str_value': pa.array(typed['str_value'], pa.string()),
+            'bytes_value': pa.array(typed['bytes_value'], pa.binary()),
+            'date_value': pa.array(typed['date_value'], pa.timestamp('us')),
+            'fields': pa.array(fields, pa.map_(pa.string(), pa.string())),
+            'refs': pa.array(refs, pa.map_(pa.string(), pa.list_(pa.int64()))),
+        })
+        return table.replace_schema_metadata({'nska.top': json.dumps(self.top, default=str)})
+
+    def __repr__(self):
+        return '<ObjectsTable of {} objects>'.format(len(self.uids))
+
+def _get_objects_table(plist):
+    if not isinstance(plist, dict) or '$archiver' not in plist:
+        raise DeserializeError('No $archiver object found! Not a NSKeyedArchive.')
+    objects = plist.get('$objects')
+    if not isinstance(objects, list):
+        raise DeserializeError('$objects not found! Not a NSKeyedArchive?')
+    top = plist.get('$top')
+    if not isinstance(top, dict):
+        raise DeserializeError('$top element not found! Not an NSKeyedArchive?')
+    uid_type = ccl_bplist.BplistUID
+    count = len(objects)
+    classnames = [None] * count
+    values = [None] * count
+    fields = [None] * count
+    refs = [None] * count
+    class_uid_names = {} # uid of a class definition -> $classname
+    for uid, obj in enumerate(objects):
+        if isinstance(obj, dict):
+            obj_fields = {}
+            obj_refs = {}
+            for key, value in obj.items():
+                if isinstance(value, uid_type):
+                    if key == '$class':
+                        class_uid = value.value
+                        if class_uid in class_uid_names:
+                            classname = class_uid_names[class_uid]
+                        else:
+                            class_obj = objects[class_uid] if 0 <= class_uid < count else None
+                            classname = class_obj.get('$classname') if isinstance(class_obj, dict) else None
+                            if not isinstance(classname, str):
+                                classname = None
+                            class_uid_names[class_uid] = classname
+                        classnames[uid] = classname
+                    else:
+                        obj_refs[key] = value.value
+                elif isinstance(value, list) and all(isinstance(v, uid_type) for v in value):
+                    obj_refs[key] = [v.value for v in value]
+                else:
+                    obj_fields[key] = value
+            fields[uid] = obj_fields
+            refs[uid] = obj_refs
+        elif not (isinstance(obj, str) and obj == '$null'):
+            values[uid] = obj
+    top = {name: value.value if isinstance(value, uid_type) else value for name, value in top.items()}
+    return ObjectsTable(classnames, values, fields, refs, top)
+
+def get_objects_table(path_or_file):
+    '''
+        Returns the $objects table of an NSKeyedArchive as an ObjectsTable, 
+        with the class name of every object resolved, but without rebuilding
+        the archive's tree (no conversion, no loop checks). Useful to find or
+        count objects by class across many archives, see ObjectsTable for the
+        columns and to_numpy()/to_arrow().
+
+        Exceptions
+        ----------
+        Same as deserialize_plist()
+    '''
+    if isinstance(path_or_file, str):
+        with open(path_or_file, 'rb') as f:
+            return _get_objects_table(_get_valid_nska_plist(f))
+    return _get_objects_table(_get_valid_nska_plist(path_or_file))
+
+def get_objects_table_from_string(bytes_to_deserialize):
+    '''Same as get_objects_table(), for an NSKeyedArchive in bytes'''
+    return _get_objects_table(_get_valid_nska_plist(io.BytesIO(bytes_to_deserialize)))
+
+_not_cached = object()
+_class_converters_snapshot = (None, None) # (copy of ccl_bplist._class_converters, its make_key() options)
+
+def _class_converters_options():
+    '''Returns the registered ccl_bplist class converters as make_key() options, so
+       that registering a converter changes the keys of results cached after it'''
+    global _class_converters_snapshot
+    converters, options = _class_converters_snapshot
+    if converters != ccl_bplist._class_converters:
+        converters = dict(ccl_bplist._class_converters)
+        options = tuple(item for classname, (required_keys, function) in sorted(converters.items())
+                             for item in (classname, required_keys, function))
+        _class_converters_snapshot = (converters, options)
+    return options
+
+_cache_busy_timeout = 5 # seconds to wait for another process' write to the cache database
+
+class ResultCache:
+    '''
+        Cache of deserialized plists, for Deserializer(cache=...). Results are
+        keyed by a hash of the input bytes, the deserialization options, the
+        class converters registered in ccl_bplist and the version, and stored
+        pickled, so each hit returns a new copy that can be modified. The least
+        recently used results are evicted once there are more than max_entries,
+        or their total (pickled) size is over max_bytes. If path is given,
+        results are also stored in a SQLite database there, to be reused across
+        runs. The database is in WAL mode and every result is committed as it
+        is stored, so several processes can share it; a read or write that
+        still fails (eg: the database stays locked) is skipped and counted in
+        stats()['db_errors']. Exceptions are not cached, nor are results while
+        a registered class converter is a lambda. Safe to use from many
+        threads, and in deserialize_many() (workers get their own memory cache
+        and connection, closed when the worker exits).
+    '''
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self._setup()
+
+    def _setup(self):
+        self._entries = collections.OrderedDict() # key -> pickled result
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_errors = 0
+        self._db = None
+        if self.path is not None:
+            # Autocommit (isolation_level=None), no transaction is left open holding the lock
+            self._db = sqlite3.connect(self.path, timeout=_cache_busy_timeout, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB)')
+
+    def __getstate__(self):
+        return (self.max_entries, self.max_bytes, self.path)
+
+    def __setstate__(self, state):
+        self.max_entries, self.max_bytes, self.path = state
+        self._setup()
+
+    @staticmethod
+    def make_key(bytes_to_deserialize, *options):
+        '''Returns the key for bytes_to_deserialize deserialized with options.
+           Functions and classes in options are identified by name, so keys are
+           the same across runs. Returns None (do not cache) if an option can
+           not be told apart by name, ie, a lambda, a function defined inside
+           another one, or an object without a repr of its own.'''
+        key = hashlib.blake2b(bytes_to_deserialize, digest_size=20)
+        for option in options:
+            if hasattr(option, '__qualname__'):
+                qualname = option.__qualname__
+                if '<lambda>' in qualname or '<locals>' in qualname:
+                    return None
+                text = repr('{}.{}'.format(getattr(option, '__module__', ''), qualname))
+            else:
+                text = repr(option)
+                if ' at 0x' in text: # default repr, only unique while the object lives
+                    return None
+            key.update(text.encode('utf8', 'replace') + b'\0')
+        return key.digest()
+
+    def get(self, key):
+        '''Returns the cached result for key, or _not_cached'''
+        with self._lock:
+            pickled = self._entries.get(key)
+            if pickled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            elif self._db is not None:
+                try:
+                    row = self._db.execute('SELECT value FROM results WHERE key=?', (key,)).fetchone()
+                except sqlite3.OperationalError: # database locked by another process
+                    self.db_errors += 1
+                    row = None
+                if row is not None:
+                    pickled = row[0]
+                    self.disk_hits += 1
+                    self._add(key, pickled)
+            if pickled is None:
+                self.misses += 1
+                return _not_cached
+        return pickle.loads(pickled)
+
+    def put(self, key, result):
+        '''Caches result for key, results that can not be pickled are not cached'''
+        try:
+            pickled = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError, RecursionError):
+            return
+        with self._lock:
+            self._add(key, pickled)
+            if self._db is not None:
+                try:
+                    self._db.execute('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)', (key, pickled))
+                except sqlite3.OperationalError: # database locked by another process
+                    self.db_errors += 1
+
+    def _add(self, key, pickled):
+        if len(pickled) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = pickled
+        self._size += len(pickled)
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        '''Returns a dict with the number of hits (disk_hits of those were from
+           the database), misses, evictions, entries and bytes in memory, and 
+           db_errors (database reads/writes that failed and were skipped)'''
+        with self._lock:
+            return {'hits': self.hits + self.disk_hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 
+                    'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self._size,
+                    'db_errors': self.db_errors}
+
+    def clear(self):
+        '''Empties the memory cache (not the database)'''
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def close(self):
+        '''Closes the database, every result is already written'''
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Deserializer:
+    '''
+        Deserializes NSKeyedArchives using its own settings, instead of any 
+        module level state. Every archive is deserialized with its own context
+        (converter, caches and traversal state), so a Deserializer can be used
+        from many threads at once without locks. The functions 
+        deserialize_plist() and deserialize_plist_from_string() use a default
+        Deserializer.
+
+        Parameters
+        ----------
+        object_converter:
+            Function applied to each NSKA object as it is resolved, default is
+            ccl_bplist.NSKeyedArchiver_common_objects_convertor
+        share_objects:
+            An object referenced from several places in an archive is only
+            deserialized once. If True, all those places hold the very same
+            dict/list, else (default) each gets its own copy.
+        cache:
+            A ResultCache for deserialize_plist_from_string(), so identical
+            blobs are only deserialized once (default is None, no cache)
+
+        These limit which nested blobs are deserialized with full_recurse_convert_nska. 
+        Only the start of a blob is checked for a plist header, and get_nested_stats()
+        gives the number of blobs scanned, converted and skipped (per reason).
+        nested_min_size, nested_max_size:
+            Blobs smaller/larger than these (in bytes) are not deserialized
+        nested_archivers_only:
+            Only deserialize plists containing '$archiver', ie, NSKA (by default 
+            any nested plist is deserialized)
+        nested_key_paths:
+            Only deserialize blobs at (or under) these paths, eg: 'items[*].data'.
+            Paths are relative to the returned plist, same as the paths for 
+            extract() and '*' also matches any key. These only apply to the top
+            level plist, not to the plists nested in it.
+        nested_executor:
+            A concurrent.futures executor (thread or process pool) to deserialize
+            the nested blobs of a plist concurrently (default is None, one at a
+            time). The result is the same. Use a ProcessPoolExecutor for real
+            parallelism, with a module level object_converter. Do not give it an
+            executor that is also running this Deserializer's own calls.
+    '''
+    def __init__(self, object_converter=ccl_bplist.NSKeyedArchiver_common_objects_convertor, share_objects=False, cache=None,
+                 nested_min_size=0, nested_max_size=None, nested_archivers_only=False, nested_key_paths=None,
+                 nested_executor=None):
+        self.object_converter = object_converter
+        self.share_objects = share_objects
+        self.cache = cache
+        self.nested_min_size = nested_min_size
+        self.nested_max_size = nested_max_size
+        self.nested_archivers_only = nested_archivers_only
+        self.nested_key_paths = nested_key_paths
+        self._key_path_states = _compile_key_paths(nested_key_paths)
+        self.nested_executor = nested_executor
+        self._setup_nested_stats()
+
+    def _setup_nested_stats(self):
+        self._nested_stats = dict.fromkeys(('scanned', 'converted', 'not_plist', 'no_archiver', 'skipped_size'), 0)
+        self._nested_stats_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_nested_stats'], state['_nested_stats_lock']
+        state['nested_executor'] = None # not for worker processes
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup_nested_stats()
+
+    def _count_nested(self, reason):
+        '''Counts a scanned blob and the reason it was skipped, None if it was not'''
+        with self._nested_stats_lock:
+            self._nested_stats['scanned'] += 1
+            if reason is not None:
+                self._nested_stats[reason] += 1
+
+    def _count_nested_converted(self):
+        with self._nested_stats_lock:
+            self._nested_stats['converted'] += 1
+
+    def get_nested_stats(self):
+        '''Returns a dict with the number of nested blobs scanned in full_recurse_convert_nska
+           mode, of those how many were converted and how many were skipped as 
+           not_plist, no_archiver or skipped_size. A blob that fails to 
+           deserialize is scanned, not converted. Counts are for this process only.'''
+        with self._nested_stats_lock:
+            return dict(self._nested_stats)
+
+    def reset_nested_stats(self):
+        with self._nested_stats_lock:
+            for reason in self._nested_stats:
+                self._nested_stats[reason] = 0
+
+    def deserialize_plist(self, path_or_file, full_recurse_convert_nska=False, format=list):
+        '''Same as nska_deserialize.deserialize_plist(), using this Deserializer'''
+        if isinstance(path_or_file, str):
+            with open(path_or_file, 'rb') as f:
+                plist = _get_valid_nska_plist(f)
+        else: # its a file
+            plist = _get_valid_nska_plist(path_or_file)
+
+        return _unpack_top_level(plist, full_recurse_convert_nska, format, self, key_path_states=self._key_path_states)
+
+    def deserialize_plist_from_string(self, bytes_to_deserialize, full_recurse_convert_nska=False, format=list):
+        '''Same as nska_deserialize.deserialize_plist_from_string(), using this Deserializer'''
+        return self._deserialize_string(bytes_to_deserialize, full_recurse_convert_nska, format, False, self._key_path_states)
+
+    def _deserialize_string(self, bytes_to_deserialize, full_recurse_convert_nska, format, lazy, key_path_states):
+        '''Deserializes bytes_to_deserialize, through the cache if there is one (not for lazy)'''
+        cache = None if lazy else self.cache
+        if cache is not None:
+            key = cache.make_key(bytes_to_deserialize, deserializer_version, full_recurse_convert_nska, format, self.object_converter,
+                                 self.share_objects, self.nested_min_size, self.nested_max_size, self.nested_archivers_only,
+                                 key_path_states, *_class_converters_options())
+            if key is None: # eg: a lambda converter, its results can not be told apart from another's
+                cache = None
+            else:
+                result = cache.get(key)
+                if result is not _not_cached:
+                    return result
+        plist = _get_valid_nska_plist(io.BytesIO(bytes_to_deserialize))
+        result = _unpack_top_level(plist, full_recurse_convert_nska, format, self, lazy, key_path_states)
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    def deserialize_plist_lazy(self, path_or_file, full_recurse_convert_nska=False, format=list):
+        '''Same as nska_deserialize.deserialize_plist_lazy(), using this Deserializer'''
+        if isinstance(path_or_file, str):
+            with open(path_or_file, 'rb') as f:
+                plist = _get_valid_nska_plist(f)
+        else: # its a file
+            plist = _get_valid_nska_plist(path_or_file)
+
+        return _unpack_top_level(plist, full_recurse_convert_nska, format, self, True, self._key_path_states)
+
+    def deserialize_plist_from_string_lazy(self, bytes_to_deserialize, full_recurse_convert_nska=False, format=list):
+        '''Same as nska_deserialize.deserialize_plist_from_string_lazy(), using this Deserializer'''
+        return self._deserialize_string(bytes_to_deserialize, full_recurse_convert_nska, format, True, self._key_path_states)
+
+    def extract(self, bytes_to_deserialize, paths, default=None):
+        '''Same as nska_deserialize.extract(), using this Deserializer'''
+        if not isinstance(paths, Selector):
+            paths = Selector(paths)
+        plist = _get_valid_nska_plist(io.BytesIO(bytes_to_deserialize))
+        if '$archiver' not in plist:
+            raise DeserializeError('No $archiver object found! Not a NSKeyedArchive.')
+        top_level = _deserialize_nska(plist, dict, self, lazy=True)
+        root_names = _get_root_element_names(plist)
+        if len(root_names) == 1:
+            top_level = { root_names[0] : top_level }
+        return [_select(top_level, steps, 0, default) for steps in paths._steps]
+
+    def deserialize_many(self, iterable_of_bytes, full_recurse_convert_nska=False, format=list, workers=None, chunksize=None):
+        '''Same as nska_deserialize.deserialize_many(), using this Deserializer'''
+        items = list(iterable_of_bytes)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, (len(items) + _min_items_per_worker - 1) // _min_items_per_worker)
+        if workers <= 1:
+            # Not worth starting processes for
+            return [_deserialize_or_error(self, data, full_recurse_convert_nska, format) for data in items]
+        if chunksize is None:
+            chunksize = max(1, min(256, len(items) // (workers * 4)))
+        pool = multiprocessing.Pool(workers, _init_worker, (self, full_recurse_convert_nska, format))
+        try:
+            results = pool.map(_deserialize_one, items, chunksize)
+            # Let the workers exit normally, so their finalizers (the cache's close) run
+            pool.close()
+            pool.join()
+            return results
+        finally:
+            pool.terminate()
+
+    async def deserialize_plist_async(self, source, full_recurse_convert_nska=False, format=list, executor=None):
+        '''Same as nska_deserialize.deserialize_plist_async(), using this Deserializer'''
+        loop = _get_running_loop()
+        data = await _read_async_source(source, loop)
+        return await loop.run_in_executor(executor, functools.partial(
+                    self.deserialize_plist_from_string, data, full_recurse_convert_nska, format))
+
+    async def deserialize_many_async(self, source, full_recurse_convert_nska=False, format=list, executor=None, max_concurrency=None):
+        '''Same as nska_deserialize.deserialize_many_async(), using this Deserializer'''
+        loop = _get_running_loop()
+        if max_concurrency is None:
+            max_concurrency = 2 * (os.cpu_count() or 1)
+        pending = collections.deque() # futures, in input order
+        try:
+            async for data in _async_iter(source):
+                if len(pending) >= max_concurrency:
+                    # Wait for the oldest before reading more (backpressure)
+                    yield await pending.popleft()
+                pending.append(loop.run_in_executor(executor, functools.partial(
+                    _deserialize_or_error, self, data, full_recurse_convert_nska, format)))
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+_default_deserializer = Deserializer()
+
+# get_event_loop() is deprecated inside coroutines, get_running_loop() is 3.7+
+_get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+async def _read_async_source(source, loop):
+    '''Returns the bytes of source: bytes, a path, or a file object with a read()
+       method (async or not, blocking reads are done in the default executor)'''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return await loop.run_in_executor(None, f.read)
+    read = source.read
+    if inspect.iscoroutinefunction(read):
+        data = await read()
+    else:
+        data = await loop.run_in_executor(None, read)
+    if inspect.isawaitable(data):
+        data = await data
+    return data
+
+async def _async_iter(source):
+    if hasattr(source, '__aiter__'):
+        async for item in source:
+            yield item
+    else:
+        for item in source:
+            yield item
+
+_min_items_per_worker = 128 # smaller batches are deserialized in process
+_worker_state = None # (deserializer, full_recurse_convert_nska, format) in deserialize_many() worker processes
+
+def _init_worker(deserializer, full_recurse_convert_nska, format):
+    '''Sets up a deserialize_many() worker process, once for all its items'''
+    global _worker_state
+    _worker_state = (deserializer, full_recurse_convert_nska, format)
+    if deserializer.cache is not None:
+        multiprocessing.util.Finalize(deserializer.cache, deserializer.cache.close, exitpriority=10)
+
+def _deserialize_one(bytes_to_deserialize):
+    deserializer, full_recurse_convert_nska, format = _worker_state
+    return _deserialize_or_error(deserializer, bytes_to_deserialize, full_recurse_convert_nska, format)
+
+def _deserialize_or_error(deserializer, bytes_to_deserialize, full_recurse_convert_nska, format):
+    '''Returns the deserialized plist, or the exception raised for it'''
+    try:
+        return deserializer.deserialize_plist_from_string(bytes_to_deserialize, full_recurse_convert_nska, format)
+    except Exception as ex:
+        return ex
+
 def deserialize_plist(path_or_file, full_recurse_convert_nska=False, format=list):
     '''
         Returns a deserialized plist as a dictionary/list. 
@@ -357,7 +1578,6 @@ def deserialize_plist(path_or_file, full_recurse_convert_nska=False, format=list
         Exceptions
         ----------
         nska_deserialize.DeserializeError, 
-        biplist.NotBinaryPlistException, 
         ccl_bplist.BplistError,
         plistlib.InvalidFileException,
         ValueError, 
@@ -365,16 +1585,7 @@ def deserialize_plist(path_or_file, full_recurse_convert_nska=False, format=list
         OSError, 
         OverflowError
     '''
-    path = ''
-    f = None
-    if isinstance(path_or_file, str):
-        path = path_or_file
-        f = open(path, 'rb')
-    else: # its a file
-        f = path_or_file
-
-    f, plist = _get_valid_nska_plist(f)
-    return _unpack_top_level(f, plist, full_recurse_convert_nska, format)
+    return _default_deserializer.deserialize_plist(path_or_file, full_recurse_convert_nska, format)
 
 def deserialize_plist_from_string(bytes_to_deserialize, full_recurse_convert_nska=False, format=list):
     '''
@@ -397,7 +1608,6 @@ def deserialize_plist_from_string(bytes_to_deserialize, full_recurse_convert_nsk
         Exceptions
         ----------
         nska_deserialize.DeserializeError, 
-        biplist.NotBinaryPlistException, 
         ccl_bplist.BplistError,
         plistlib.InvalidFileException,
         ValueError, 
@@ -405,42 +1615,354 @@ def deserialize_plist_from_string(bytes_to_deserialize, full_recurse_convert_nsk
         OSError, 
         OverflowError
     '''
-    f, plist = _get_valid_nska_plist(io.BytesIO(bytes_to_deserialize))
-    return _unpack_top_level(f, plist, full_recurse_convert_nska, format)
-
-def _get_json_writeable_plist(in_plist, out_plist):
-    if isinstance(in_plist, list):
-        for item in in_plist:
-            if isinstance(item, list):
-                i = []
-                out_plist.append(i)
-                _get_json_writeable_plist(item, i)
-            elif isinstance(item, dict):
-                i = {}
-                out_plist.append(i)
-                _get_json_writeable_plist(item, i)
-            elif isinstance(item, bytes):
-                out_plist.append(item.hex())
+    return _default_deserializer.deserialize_plist_from_string(bytes_to_deserialize, full_recurse_convert_nska, format)
+
+def deserialize_plist_lazy(path_or_file, full_recurse_convert_nska=False, format=list):
+    '''
+        Same as deserialize_plist(), but dictionaries and lists of the archive
+        are returned as read only lazy views (NskaLazyDict, NskaLazyList), 
+        which deserialize objects only as they are accessed. Use this to read
+        a few values out of a large archive. Fully iterated, the views are
+        equal to the plist deserialize_plist() returns, materialize_plist()
+        converts them to that. If full_recurse_convert_nska, nested NSKA are
+        deserialized (also lazily) when accessed, so their exceptions are
+        raised at that point.
+
+        Exceptions
+        ----------
+        Same as deserialize_plist()
+    '''
+    return _default_deserializer.deserialize_plist_lazy(path_or_file, full_recurse_convert_nska, format)
+
+def deserialize_plist_from_string_lazy(bytes_to_deserialize, full_recurse_convert_nska=False, format=list):
+    '''
+        Same as deserialize_plist_from_string(), but returns lazy views, see 
+        deserialize_plist_lazy()
+    '''
+    return _default_deserializer.deserialize_plist_from_string_lazy(bytes_to_deserialize, full_recurse_convert_nska, format)
+
+def extract(bytes_to_deserialize, paths, default=None):
+    '''
+        Returns the values at paths in an NSKeyedArchive, deserializing only the
+        objects on those paths instead of the whole archive.
+
+        Parameters
+        ----------
+        bytes_to_deserialize:
+            Bytes representation of an NSKeyedArchive 
+        paths:
+            A list of paths (or a Selector from compile_selector()). A path 
+            starts at a $top element name, followed by dict keys separated by
+            '.' and list indexes as [n], or [*] for all items of a list, eg:
+            'root.items[*].URL' or 'root.creationDate'. Keys containing dots
+            are matched as is, the longest existing key is used.
+        default:
+            Value returned for a path that is not found
+
+        Returns
+        -------
+        A list with one value per path, a path with [*] gives a list of values.
+        Values are the same as deserialize_plist() returns at that path.
+
+        Exceptions
+        ----------
+        Same as deserialize_plist_from_string(), ValueError for an invalid path
+    '''
+    return _default_deserializer.extract(bytes_to_deserialize, paths, default)
+
+def deserialize_many(iterable_of_bytes, full_recurse_convert_nska=False, format=list, workers=None, chunksize=None):
+    '''
+        Deserializes many NSKeyedArchives (eg: blobs from a database column) 
+        with a pool of worker processes. Each worker is set up once, with the
+        Deserializer and options, and is then sent the blobs in chunks. Small
+        batches are deserialized in this process instead. On platforms that
+        spawn processes (Windows, macOS), call this from under 
+        if __name__ == '__main__', and use a module level object_converter.
+
+        Parameters
+        ----------
+        iterable_of_bytes:
+            Bytes representations of NSKeyedArchives
+        full_recurse_convert_nska, format:
+            Same as deserialize_plist_from_string()
+        workers:
+            Number of worker processes, default is the number of CPUs. With 1
+            everything is deserialized in this process.
+        chunksize:
+            Number of blobs sent to a worker at a time, by default the blobs
+            are split in about 4 chunks per worker (at most 256 per chunk)
+
+        Returns
+        -------
+        A list with one item per blob, in the same order. The item is the
+        deserialized plist, or the exception raised for that blob (exceptions
+        from deserialize_plist_from_string() are not raised).
+    '''
+    return _default_deserializer.deserialize_many(iterable_of_bytes, full_recurse_convert_nska, format, workers, chunksize)
+
+async def deserialize_plist_async(source, full_recurse_convert_nska=False, format=list, executor=None):
+    '''
+        Same as deserialize_plist_from_string(), for asyncio. Reading and 
+        deserializing are done in an executor, so the event loop is not blocked.
+
+        Parameters
+        ----------
+        source:
+            Bytes representation of an NSKeyedArchive, a path, or a file object
+            (an async file, with a coroutine read(), or a normal file)
+        full_recurse_convert_nska, format:
+            Same as deserialize_plist_from_string()
+        executor:
+            concurrent.futures executor to deserialize in, default is the event
+            loop's default (thread pool). Deserializing is CPU bound, use a
+            ProcessPoolExecutor to make use of several CPUs.
+
+        Exceptions
+        ----------
+        Same as deserialize_plist_from_string()
+    '''
+    return await _default_deserializer.deserialize_plist_async(source, full_recurse_convert_nska, format, executor)
+
+def deserialize_many_async(source, full_recurse_convert_nska=False, format=list, executor=None, max_concurrency=None):
+    '''
+        Asynchronous generator, deserializes the blobs from source (an iterable 
+        or async iterable of bytes) in an executor and yields the results in 
+        the same order. A blob that fails gives the exception instead of a 
+        result, as in deserialize_many(). At most max_concurrency blobs (default 
+        is twice the number of CPUs) are deserialized or waiting to be yielded
+        at a time, source is not read further until one is done.
+
+            async for result in nd.deserialize_many_async(rows, executor=pool):
+                ...
+
+        executor is the same as for deserialize_plist_async()
+    '''
+    return _default_deserializer.deserialize_many_async(source, full_recurse_convert_nska, format, executor, max_concurrency)
+
+_json_dict_types = (dict, NskaLazyDict)
+_json_list_types = (list, NskaLazyList)
+_json_flush_parts = 8192
+# Exact types that are never containers, checked first as isinstance() with the
+# lazy views (abc classes) is slow
+_json_scalar_types = frozenset((str, int, float, bool, bytes, type(None), datetime.datetime))
+
+def _json_key(key, encode_str=json.encoder.encode_basestring_ascii):
+    '''Returns a dict key as json, same as the json module does'''
+    if isinstance(key, str):
+        return encode_str(key)
+    if key is True:
+        return '"true"'
+    if key is False:
+        return '"false"'
+    if key is None:
+        return '"null"'
+    if isinstance(key, float):
+        return '"' + _json_float(key) + '"'
+    if isinstance(key, int):
+        return '"' + int.__repr__(key) + '"'
+    raise TypeError('keys must be str, int, float, bool or None, not {}'.format(type(key).__name__))
+
+def _json_float(value):
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == -float('inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+def _json_scalar_encoder(iso_dates=False, native_numbers=False, bytes_encoding='hex', ensure_ascii=True):
+    '''Returns a function that converts a scalar (not dict/list) plist value to json.
+       By default everything is written as a string, as str() returns it, with 
+       bytes in hex.'''
+    if bytes_encoding not in ('hex', 'base64'):
+        raise ValueError("bytes_encoding must be 'hex' or 'base64'")
+    encode_str = json.encoder.encode_basestring_ascii if ensure_ascii else json.encoder.encode_basestring
+    def encode(value):
+        if isinstance(value, str):
+            return encode_str(value)
+        if isinstance(value, bytes):
+            if bytes_encoding == 'hex':
+                return encode_str(value.hex())
+            return encode_str(binascii.b2a_base64(value, newline=False).decode('ascii'))
+        if native_numbers:
+            if value is None:
+                return 'null'
+            if value is True:
+                return 'true'
+            if value is False:
+                return 'false'
+            if isinstance(value, int):
+                return int.__repr__(value)
+            if isinstance(value, float):
+                return _json_float(value)
+        if iso_dates and isinstance(value, datetime.datetime):
+            return encode_str(value.isoformat())
+        return encode_str(str(value))
+    return encode
+
+def _write_json(plist, write, encode_scalar, ensure_ascii=True, compact=False):
+    '''Writes plist as json with write(), in pieces as it is encoded. The plist is
+       walked with an explicit stack, and nothing is copied. Lazy views are 
+       written as the dicts/lists they represent. Separators are the same as
+       json.dump(), or without spaces if compact.
+    '''
+    encode_str = json.encoder.encode_basestring_ascii if ensure_ascii else json.encoder.encode_basestring
+    item_separator, key_separator = (',', ':') if compact else (', ', ': ')
+    parts = []
+    append = parts.append
+    stack = []
+    if isinstance(plist, _json_dict_types):
+        append('{')
+        stack.append((iter(plist.items()), True))
+    elif isinstance(plist, _json_list_types):
+        append('[')
+        stack.append((iter(plist), False))
+    else:
+        append(encode_scalar(plist))
+    first = True
+    while stack:
+        items, is_dict = stack[-1]
+        for item in items:
+            if first:
+                first = False
+            else:
+                append(item_separator)
+            if is_dict:
+                key, value = item
+                append(encode_str(key) if type(key) is str else _json_key(key, encode_str))
+                append(key_separator)
+            else:
+                value = item
+            if type(value) in _json_scalar_types:
+                append(encode_scalar(value))
+            elif isinstance(value, _json_dict_types):
+                append('{')
+                stack.append((iter(value.items()), True))
+                first = True
+                break
+            elif isinstance(value, _json_list_types):
+                append('[')
+                stack.append((iter(value), False))
+                first = True
+                break
+            else:
+                append(encode_scalar(value))
+        else:
+            stack.pop()
+            append('}' if is_dict else ']')
+            first = False
+        if len(parts) >= _json_flush_parts:
+            write(''.join(parts))
+            parts.clear()
+    write(''.join(parts))
+
+def _json_default(bytes_encoding):
+    '''Returns the default hook for orjson, for the types it does not encode'''
+    def default(value):
+        if isinstance(value, bytes):
+            if bytes_encoding == 'hex':
+                return value.hex()
+            return binascii.b2a_base64(value, newline=False).decode('ascii')
+        if isinstance(value, NskaLazyDict):
+            return dict(value.items())
+        if isinstance(value, NskaLazyList):
+            return list(value)
+        return str(value) # datetime (unless iso_dates), ccl_bplist.BplistUID, UUID, etc
+    return default
+
+def _stringified_copy(plist, encode_scalar):
+    '''Returns a copy of plist with scalar values converted by encode_scalar, for orjson'''
+    if not isinstance(plist, _json_dict_types + _json_list_types):
+        return encode_scalar(plist)
+    copy = {} if isinstance(plist, _json_dict_types) else []
+    stack = [(plist, copy)]
+    while stack:
+        source, target = stack.pop()
+        is_dict = isinstance(target, dict)
+        for k, v in (source.items() if is_dict else enumerate(source)):
+            if isinstance(v, _json_dict_types):
+                c = {}
+                stack.append((v, c))
+            elif isinstance(v, _json_list_types):
+                c = []
+                stack.append((v, c))
+            elif isinstance(v, str):
+                c = v
             else:
-                out_plist.append(str(item))
-    else: #dict
-        for k, v in in_plist.items():
-            if isinstance(v, list):
-                i = []
-                out_plist[k] = i
-                _get_json_writeable_plist(v, i)
-            elif isinstance(v, dict):
-                i = {}
-                out_plist[k] = i
-                _get_json_writeable_plist(v, i)
-            elif isinstance(v, bytes):
-                out_plist[k] = v.hex()
+                c = encode_scalar(v)
+            if is_dict:
+                target[k] = c
             else:
-                out_plist[k] = str(v)
+                target.append(c)
+    return copy
 
-def write_plist_to_json_file(deserialized_plist, output_path):
+def _stringify_scalar(iso_dates, bytes_encoding):
+    '''Returns a function converting a scalar to the string written by default'''
+    def stringify(value):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, bytes):
+            if bytes_encoding == 'hex':
+                return value.hex()
+            return binascii.b2a_base64(value, newline=False).decode('ascii')
+        if iso_dates and isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return str(value)
+    return stringify
+
+def dumps_json(deserialized_plist, iso_dates=False, native_numbers=False, bytes_encoding='hex', backend='auto'):
     '''
-        Converts the plist to a json file and writes it out.
+        Returns the plist as compact json (no spaces), encoded in UTF-8.
+
+        Parameters
+        ----------
+        deserialized_plist:
+            A dictionary/list representing a plist
+        iso_dates, native_numbers, bytes_encoding:
+            Same as write_plist_to_json_file()
+        backend:
+            'orjson' (must be installed), 'json' (the standard library) or 
+            'auto' (default) to use orjson if it is installed, else json.
+            Unless native_numbers is used, the output is byte for byte the same 
+            with either backend (all values are written as strings). With 
+            native_numbers, floats may be written differently (eg: 1e16 or 
+            1e+16) and nan/infinity are null with orjson.
+
+        Exceptions
+        ----------
+        TypeError, ValueError
+    '''
+    if backend == 'auto':
+        backend = 'json' if orjson is None else 'orjson'
+    if backend == 'orjson':
+        if orjson is None:
+            raise ValueError('orjson is not installed')
+        if bytes_encoding not in ('hex', 'base64'):
+            raise ValueError("bytes_encoding must be 'hex' or 'base64'")
+        if native_numbers:
+            option = orjson.OPT_NON_STR_KEYS
+            if not iso_dates:
+                option |= orjson.OPT_PASSTHROUGH_DATETIME
+            try:
+                return orjson.dumps(deserialized_plist, default=_json_default(bytes_encoding), option=option)
+            except orjson.JSONEncodeError: # eg: integers over 64 bits, use json
+                pass
+        else:
+            plist = _stringified_copy(deserialized_plist, _stringify_scalar(iso_dates, bytes_encoding))
+            return orjson.dumps(plist, default=_json_default(bytes_encoding), option=orjson.OPT_NON_STR_KEYS)
+    elif backend != 'json':
+        raise ValueError("backend must be 'auto', 'orjson' or 'json'")
+    parts = []
+    _write_json(deserialized_plist, parts.append, 
+                _json_scalar_encoder(iso_dates, native_numbers, bytes_encoding, ensure_ascii=False), 
+                ensure_ascii=False, compact=True)
+    return ''.join(parts).encode('utf8')
+
+def write_plist_to_json_file(deserialized_plist, output_path, iso_dates=False, native_numbers=False, bytes_encoding='hex', backend=None):
+    '''
+        Converts the plist to a json file and writes it out. The json is 
+        streamed to the file as it is encoded, the plist is not copied.
 
         Parameters
         ----------
@@ -450,17 +1972,271 @@ def write_plist_to_json_file(deserialized_plist, output_path):
         output_path
             Path (including filename) where file will be saved
 
+        iso_dates:
+            Write dates in ISO 8601 format, instead of str() of the date 
+
+        native_numbers:
+            Write numbers, booleans and None as json numbers, true/false and null,
+            instead of as strings
+
+        bytes_encoding:
+            'hex' (default) or 'base64'
+
+        backend:
+            None (default) writes the json as always (same as json.dump()). 
+            'auto', 'orjson' or 'json' writes compact UTF-8 json, same as
+            dumps_json() with that backend, which is faster with orjson.
+
         Exceptions
         ----------
         Json may raise TypeError, ValueError
     '''
+    if backend is not None:
+        data = dumps_json(deserialized_plist, iso_dates, native_numbers, bytes_encoding, backend)
+        with open(output_path, 'wb') as out_file:
+            out_file.write(data)
+        return
+    encode_scalar = _json_scalar_encoder(iso_dates, native_numbers, bytes_encoding)
+    with open(output_path, 'w', encoding='ascii', buffering=1024 * 1024) as out_file:
+        _write_json(deserialized_plist, out_file.write, encode_scalar)
 
-    out_file = open(output_path, 'w')
+def write_plists_to_jsonl_file(deserialized_plists, output_path, iso_dates=False, native_numbers=False, bytes_encoding='hex'):
+    '''
+        Writes several plists (eg: from deserialize_many()) to a JSON Lines file,
+        one plist per line. Options are the same as write_plist_to_json_file().
+        Exceptions (blobs that failed in deserialize_many()) are skipped, as in
+        write_plists_to_parquet_file(). Returns the number of lines written.
+    '''
+    encode_scalar = _json_scalar_encoder(iso_dates, native_numbers, bytes_encoding)
+    count = 0
+    with open(output_path, 'w', encoding='ascii', buffering=1024 * 1024) as out_file:
+        for plist in deserialized_plists:
+            if isinstance(plist, Exception):
+                continue
+            _write_json(plist, out_file.write, encode_scalar)
+            out_file.write('\n')
+            count += 1
+    return count
 
-    json_plist = {} if isinstance(deserialized_plist, dict) else []
-    _get_json_writeable_plist(deserialized_plist, json_plist)
-    json.dump(json_plist, out_file)
-    out_file.close()
+_max_arrow_depth = 64 # deeper values are written as json text
+_stringify_arrow_scalar = _stringify_scalar(True, 'hex')
+
+def _describe_arrow_value(value, depth=0):
+    '''Returns the column type for value, for _infer_arrow_schema(): None (only
+       nulls), a type name, ('struct', {name: type}) or ('list', item type)'''
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int' if -2**63 <= value < 2**63 else 'str'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, bytes):
+        return 'bytes'
+    if isinstance(value, datetime.datetime):
+        return 'date'
+    if depth < _max_arrow_depth:
+        if isinstance(value, dict):
+            fields = {}
+            for k, v in value.items():
+                k = str(k)
+                fields[k] = _merge_arrow_types(fields[k], _describe_arrow_value(v, depth + 1)) if k in fields else _describe_arrow_value(v, depth + 1)
+            return ('struct', fields)
+        if isinstance(value, list):
+            item_type = None
+            for v in value:
+                item_type = _merge_arrow_types(item_type, _describe_arrow_value(v, depth + 1))
+            return ('list', item_type)
+    return 'str'
+
+def _merge_arrow_types(a, b):
+    '''Returns a column type that holds values of type a and b, values that
+       have nothing in common are written as strings'''
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if a in ('int', 'float') and b in ('int', 'float'):
+        return 'float'
+    if isinstance(a, tuple) and isinstance(b, tuple) and a[0] == b[0]:
+        if a[0] == 'list':
+            return ('list', _merge_arrow_types(a[1], b[1]))
+        fields = dict(a[1])
+        for k, t in b[1].items():
+            fields[k] = _merge_arrow_types(fields[k], t) if k in fields else t
+        return ('struct', fields)
+    return 'str'
+
+def _arrow_type(pa, desc):
+    if desc is None:
+        return pa.null()
+    if isinstance(desc, tuple):
+        if desc[0] == 'list':
+            return pa.list_(_arrow_type(pa, desc[1]))
+        if not desc[1]:
+            return pa.null() # no fields, parquet can not store an empty struct
+        return pa.struct([pa.field(k, _arrow_type(pa, t)) for k, t in desc[1].items()])
+    return {'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(),
+            'bytes': pa.binary(), 'date': pa.timestamp('us')}[desc]
+
+def _infer_arrow_schema(pa, rows):
+    '''Returns a pyarrow.Schema that holds all of rows (dicts)'''
+    desc = ('struct', {})
+    for row in rows:
+        desc = _merge_arrow_types(desc, _describe_arrow_value(row))
+    return pa.schema([pa.field(k, _arrow_type(pa, t)) for k, t in desc[1].items()])
+
+def _to_arrow_value(pa, value, arrow_type, strict=False, path='row'):
+    '''Returns value converted to fit arrow_type where the schema expects it: 
+       any value as a string (containers as json), ints as floats, values of
+       a null column as None and struct fields not in arrow_type left out.
+       If strict, a value or key that does not fit arrow_type raises ValueError
+       (path is where value is, for the message) instead.'''
+    if value is None:
+        return None
+    if pa.types.is_null(arrow_type):
+        if strict and value != {}: # empty dicts have no struct type, nothing is lost
+            raise ValueError('{} is {}, the inferred schema only has nulls there'.format(path, type(value).__name__))
+        return None
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (dict, list)):
+            return dumps_json(value, iso_dates=True, native_numbers=True, backend='json').decode('utf-8')
+        return _stringify_arrow_scalar(value)
+    if pa.types.is_floating(arrow_type) and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if pa.types.is_struct(arrow_type) and isinstance(value, dict):
+        if any(not isinstance(k, str) for k in value):
+            value = {str(k): v for k, v in value.items()}
+        if strict:
+            extra = [k for k in value if arrow_type.get_field_index(k) < 0]
+            if extra:
+                raise ValueError('{} has keys that are not in the inferred schema: {}'.format(path, ', '.join(extra)))
+        return {field.name: _to_arrow_value(pa, value.get(field.name), field.type, strict, path + '.' + field.name) for field in arrow_type}
+    if (pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type)) and isinstance(value, list):
+        item_type = arrow_type.value_type
+        item_path = path + '[]'
+        return [_to_arrow_value(pa, v, item_type, strict, item_path) for v in value]
+    if strict and not _fits_arrow_type(pa, value, arrow_type):
+        raise ValueError('{} is {}, the inferred schema has {} there'.format(path, type(value).__name__, arrow_type))
+    return value
+
+def _fits_arrow_type(pa, value, arrow_type):
+    '''True if the scalar value can be stored as arrow_type without conversion'''
+    if isinstance(value, bool):
+        return pa.types.is_boolean(arrow_type)
+    if isinstance(value, int):
+        return pa.types.is_integer(arrow_type)
+    if isinstance(value, float):
+        return pa.types.is_floating(arrow_type)
+    if isinstance(value, bytes):
+        return pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type)
+    if isinstance(value, datetime.datetime):
+        return pa.types.is_timestamp(arrow_type)
+    return False
+
+def _plists_to_arrow_rows(deserialized_plists):
+    '''Yields each plist as a row (dict), skipping exceptions'''
+    for plist in deserialized_plists:
+        if isinstance(plist, Exception):
+            continue # a blob that failed in deserialize_many()
+        if isinstance(plist, (NskaLazyDict, NskaLazyList)):
+            plist = materialize_plist(plist)
+        if not isinstance(plist, dict):
+            plist = {'root': plist}
+        yield plist
+
+def _write_plists_arrow(deserialized_plists, output_path, schema, rows_per_batch, infer_rows, open_writer):
+    '''Writes the plists as batches of rows_per_batch rows with the writer from
+       open_writer(pa, output_path, schema), returns the number of rows written.
+       If schema is None, it is inferred from the first infer_rows rows (default
+       rows_per_batch) and every row must fit it. Nothing is left at output_path
+       if writing fails.'''
+    pa = _import_optional('pyarrow', 'arrow')
+    if rows_per_batch < 1:
+        raise ValueError('rows_per_batch must be at least 1')
+    rows = _plists_to_arrow_rows(deserialized_plists)
+    strict = schema is None
+    if strict:
+        sample = list(itertools.islice(rows, infer_rows or rows_per_batch))
+        schema = _infer_arrow_schema(pa, sample)
+        rows = itertools.chain(sample, rows)
+    row_type = pa.struct(list(schema))
+    writer = open_writer(pa, output_path, schema)
+    count = 0
+    try:
+        while True:
+            batch = [_to_arrow_value(pa, row, row_type, strict, 'row {}'.format(count + i))
+                     for i, row in enumerate(itertools.islice(rows, rows_per_batch))]
+            if not batch:
+                break
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    except BaseException:
+        writer.close()
+        os.remove(output_path) # not a partial file
+        raise
+    writer.close()
+    return count
+
+def _open_parquet_writer(compression):
+    def open_writer(pa, output_path, schema):
+        pq = _import_optional('pyarrow.parquet', 'arrow')
+        return pq.ParquetWriter(output_path, schema, compression=compression)
+    return open_writer
+
+def _open_arrow_writer(pa, output_path, schema):
+    return pa.ipc.new_file(output_path, schema)
+
+def write_plists_to_parquet_file(deserialized_plists, output_path, schema=None, rows_per_batch=10000, compression='snappy', infer_rows=None):
+    '''
+        Writes several plists (eg: from deserialize_many()) to a Parquet file,
+        one row per plist. Needs pyarrow (pip3 install nska_deserialize[arrow]).
+
+        Parameters
+        ----------
+        deserialized_plists:
+            Iterable of dictionaries/lists representing plists. A plist that is
+            not a dict is written as a row with one column, 'root'. Exceptions
+            (blobs that failed in deserialize_many()) are skipped.
+        output_path:
+            Path (including filename) where file will be saved
+        schema:
+            pyarrow.Schema of the rows, eg: one per archive type. Keys not in
+            the schema are left out, missing ones are null. If None, it is
+            inferred from the first infer_rows rows: dicts become structs, lists
+            become lists, dates are timestamps and bytes are binary. Values of
+            different types in a column (or nested deeper than 64 levels) are 
+            written as strings, containers as json. A later row with a key or
+            a value type that is not in the inferred schema raises ValueError.
+        rows_per_batch:
+            Rows held in memory and written at a time, each batch is a row group
+        compression:
+            Parquet compression, eg: 'snappy', 'zstd' or None
+        infer_rows:
+            Rows read (and held in memory) to infer the schema, default is
+            rows_per_batch. Use more if keys or types vary between archives.
+
+        Returns
+        -------
+        The number of rows written
+
+        Exceptions
+        ----------
+        ImportError (pyarrow is not installed), ValueError (a row does not fit
+        the inferred schema), pyarrow.ArrowException (a value does not fit 
+        the given schema), OSError. The file is removed if writing fails.
+    '''
+    return _write_plists_arrow(deserialized_plists, output_path, schema, rows_per_batch, infer_rows, _open_parquet_writer(compression))
+
+def write_plists_to_arrow_file(deserialized_plists, output_path, schema=None, rows_per_batch=10000, infer_rows=None):
+    '''
+        Same as write_plists_to_parquet_file(), but writes an Arrow IPC (feather
+        v2) file, one record batch per batch of rows.
+    '''
+    return _write_plists_arrow(deserialized_plists, output_path, schema, rows_per_batch, infer_rows, _open_arrow_writer)
 
 def write_plist_to_file(deserialized_plist, output_path):
     '''
@@ -482,3 +2258,114 @@ def write_plist_to_file(deserialized_plist, output_path):
     out_file = open(output_path, 'wb')
     plistlib.dump(deserialized_plist, out_file, fmt=plistlib.FMT_BINARY)
     out_file.close()
+
+def _is_nska_file(path):
+    '''Returns True if the file at path looks like an NSKeyedArchive, ie, it is a
+       binary or xml plist containing '$archiver'. This is checked without parsing
+       the file, so a few files that pass may still not be NSKA. Anything that is not
+       a regular file (fifos, devices, sockets) is not opened, as reading it could block.
+    '''
+    if not stat.S_ISREG(os.stat(path).st_mode):
+        return False
+    with open(path, 'rb') as f:
+        header = f.read(64)
+        if header[:8] != b'bplist00' and not header.lstrip(b" \r\n\t").startswith(_xml_plist_prefixes):
+            return False
+        f.seek(0)
+        with ccl_bplist.open_buffer(f) as buf:
+            return _archiver_pattern.search(buf) is not None
+
+def _convert_file(task):
+    '''Converts a single file for main(), in a worker process or in process. task is 
+       (input_path, output_path, output_format). Returns (status, input_path, message) 
+       where status is 'converted', 'skipped' or 'error' and message is the json line 
+       (for jsonl) or the error.
+    '''
+    deserializer, full_recurse_convert_nska, format = _worker_state
+    input_path, output_path, output_format = task
+    try:
+        if not _is_nska_file(input_path):
+            return ('skipped', input_path, None)
+        plist = deserializer.deserialize_plist(input_path, full_recurse_convert_nska, format)
+        if output_format == 'jsonl':
+            line = []
+            _write_json({'path': input_path, 'plist': plist}, line.append, _json_scalar_encoder())
+            return ('converted', input_path, ''.join(line))
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        if output_format == 'json':
+            write_plist_to_json_file(plist, output_path)
+        else:
+            write_plist_to_file(plist, output_path)
+        return ('converted', input_path, None)
+    except Exception as ex: # all possible errors from libraries imported
+        return ('error', input_path, '{}: {}'.format(type(ex).__name__, ex))
+
+def _find_files(paths, output_dir, output_format):
+    '''Yields conversion tasks for all files in paths (files or folders, walked recursively)'''
+    extension = '.plist' if output_format == 'plist' else '.json'
+    for path in paths:
+        if os.path.isdir(path):
+            found = ((os.path.join(root, name), path) for root, _, names in os.walk(path) for name in sorted(names))
+        else:
+            found = [(path, os.path.dirname(path))]
+        for input_path, base in found:
+            if output_dir is None:
+                output_path = input_path + '_deserialized' + extension
+            else:
+                output_path = os.path.join(output_dir, os.path.relpath(input_path, base) + '_deserialized' + extension)
+            yield (input_path, output_path, output_format)
+
+def main(argv=None):
+    '''Command line interface, converts all NSKeyedArchives found in the files and 
+       folders given. Run with -h for the options.'''
+    parser = argparse.ArgumentParser(prog='nska-deserialize', 
+        description='Converts NSKeyedArchiver plists in files and folders (searched recursively) to json, jsonl or plist')
+    parser.add_argument('paths', nargs='+', help='Files or folders to convert')
+    parser.add_argument('-o', '--output', help='Output folder (json, plist), default is next to each file, '
+                        'or output file (jsonl), default is stdout')
+    parser.add_argument('-f', '--format', choices=('json', 'jsonl', 'plist'), default='json', help='Output format (default json)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes (default is number of CPUs)')
+    parser.add_argument('-r', '--full-recurse', action='store_true', help='Also deserialize nested NSKA (full_recurse_convert_nska)')
+    parser.add_argument('-d', '--dict', action='store_true', help='Top level of output is a dictionary, instead of a list')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Do not print errors for each file')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + deserializer_version)
+    args = parser.parse_args(argv)
+
+    output_dir = None if args.format == 'jsonl' else args.output
+    worker_args = (_default_deserializer, args.full_recurse, dict if args.dict else list)
+    tasks = _find_files(args.paths, output_dir, args.format)
+    counts = {'converted': 0, 'skipped': 0, 'error': 0}
+    jsonl_file = None
+    if args.format == 'jsonl':
+        jsonl_file = open(args.output, 'w') if args.output else sys.stdout
+    start_time = time.perf_counter()
+    pool = None
+    try:
+        if args.workers > 1:
+            pool = multiprocessing.Pool(args.workers, _init_worker, worker_args)
+            results = pool.imap_unordered(_convert_file, tasks, 16)
+        else:
+            _init_worker(*worker_args)
+            results = map(_convert_file, tasks)
+        for status, input_path, message in results:
+            counts[status] += 1
+            if status == 'error':
+                if not args.quiet:
+                    print('Error in {} - {}'.format(input_path, message), file=sys.stderr)
+            elif message is not None:
+                jsonl_file.write(message + '\n')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if jsonl_file is not None and jsonl_file is not sys.stdout:
+            jsonl_file.close()
+    elapsed = time.perf_counter() - start_time
+    total = sum(counts.values())
+    print('Converted {} of {} files, {} errors, {} skipped (not NSKA) in {:.2f}s ({:.1f} files/s)'.format(
+          counts['converted'], total, counts['error'], counts['skipped'], elapsed, total / elapsed if elapsed else 0.0), 
+          file=sys.stderr)
+    return 1 if counts['error'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,7 +9,7 @@ req = [x.strip() for x in req if x.strip()]
 
 setuptools.setup(
     name="nska_deserialize",
-    version="1.5.1",
+    version="1.6.0",
     author="Yogesh Khatri",
     author_email="yogesh@swiftforensics.com",
     description="Convert NSKeyedArchiver plist into a deserialized human readable plist",
@@ -19,6 +19,14 @@ setuptools.setup(
     py_modules=["nska_deserialize", "ccl_bplist"],
     #packages=setuptools.find_packages(),
     install_requires=req,
+    extras_require={
+        "orjson": ["orjson"],
+        "numpy": ["numpy"],
+        "arrow": ["pyarrow"],
+    },
+    entry_points={
+        "console_scripts": ["nska-deserialize=nska_deserialize:main"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules are at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ccl_bplist
+
+@pytest.fixture
+def class_converters():
+    '''Restores the converters registered in ccl_bplist after the test'''
+    saved = dict(ccl_bplist._class_converters)
+    yield ccl_bplist._class_converters
+    ccl_bplist._class_converters.clear()
+    ccl_bplist._class_converters.update(saved)
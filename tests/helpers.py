@@ -0,0 +1,89 @@
+'''Test helpers: the regression corpus and a builder for small NSKeyedArchiver archives'''
+
+import datetime
+import os
+import plistlib
+
+from plistlib import UID
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+corpus_dir = os.path.join(tests_dir, 'corpus')
+expected_dir = os.path.join(tests_dir, 'expected')
+
+def corpus_names():
+    return sorted(os.listdir(corpus_dir))
+
+def corpus_path(name):
+    return os.path.join(corpus_dir, name)
+
+def expected_results(name):
+    '''Returns {(full_recurse_convert_nska, format name): expected} for a corpus file,
+       expected is ('ok', plist) or ('error', exception class name)'''
+    with open(os.path.join(expected_dir, name + '.txt'), encoding='utf8') as f:
+        grouped = eval(f.read(), {'datetime': datetime})
+    return {options: result for options_list, result in grouped.items() for options in options_list}
+
+def outcome(function, *args, **kwargs):
+    '''Returns function's result in the form of expected_results()'''
+    try:
+        return ('ok', function(*args, **kwargs))
+    except Exception as ex:
+        return ('error', type(ex).__name__)
+
+class ArchiveBuilder:
+    '''Builds an NSKeyedArchiver $objects table, add() returns the uid of an object'''
+    def __init__(self):
+        self.objects = ['$null']
+        self.classes = {}
+
+    def add(self, obj):
+        self.objects.append(obj)
+        return UID(len(self.objects) - 1)
+
+    def reserve(self):
+        '''Adds a placeholder, set it later with set(), for objects that refer to themselves'''
+        return self.add(None)
+
+    def set(self, uid, obj):
+        self.objects[uid.data] = obj
+
+    def cls(self, name):
+        if name not in self.classes:
+            self.classes[name] = self.add({'$classname': name, '$classes': [name, 'NSObject']})
+        return self.classes[name]
+
+    def dict_object(self, keys, values, classname='NSDictionary'):
+        return {'$class': self.cls(classname), 'NS.keys': [self.add(k) for k in keys], 'NS.objects': list(values)}
+
+    def dict(self, keys, values, classname='NSDictionary'):
+        return self.add(self.dict_object(keys, values, classname))
+
+    def array(self, values, classname='NSArray'):
+        return self.add({'$class': self.cls(classname), 'NS.objects': list(values)})
+
+    def archive(self, root, top_key='root'):
+        return {'$archiver': 'NSKeyedArchiver', '$version': 100000, '$top': {top_key: root}, '$objects': self.objects}
+
+    def binary(self, root, top_key='root'):
+        return plistlib.dumps(self.archive(root, top_key), fmt=plistlib.FMT_BINARY, sort_keys=False)
+
+def nested_archive(depth, kinds=('NSDictionary',)):
+    '''Returns an archive of objects nested depth levels deep, cycling through the
+       class names in kinds (NSDictionary, NSArray or NSSet), with 'leaf' innermost'''
+    b = ArchiveBuilder()
+    child = b.add('leaf')
+    for level in range(depth):
+        kind = kinds[level % len(kinds)]
+        if kind == 'NSDictionary':
+            child = b.dict(['child'], [child])
+        else:
+            child = b.array([child], kind)
+    return b.binary(child)
+
+def unwrap(value):
+    '''Returns (the innermost value, levels) of a nested_archive() result'''
+    levels = 0
+    while isinstance(value, (dict, list)):
+        value = value['child'] if isinstance(value, dict) else value[0]
+        levels += 1
+    return value, levels
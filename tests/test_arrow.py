@@ -0,0 +1,58 @@
+import datetime
+import os
+
+import pytest
+
+import nska_deserialize as nd
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+feather = pytest.importorskip('pyarrow.feather')
+
+def read_parquet(path):
+    return pq.read_table(path).to_pylist()
+
+def read_arrow(path):
+    return feather.read_table(path).to_pylist()
+
+writers = [(nd.write_plists_to_parquet_file, read_parquet), (nd.write_plists_to_arrow_file, read_arrow)]
+
+@pytest.mark.parametrize('write,read', writers)
+def test_round_trip(write, read, tmp_path):
+    path = str(tmp_path / 'out')
+    rows = [{'n': i, 'name': 'row {}'.format(i), 'date': datetime.datetime(2020, 1, 1, 0, 0, i), 'data': bytes([i]),
+             'items': [{'x': i}, {'x': i + 1}], 'nested': {'flag': i % 2 == 0}} for i in range(7)]
+    assert write(rows + [ValueError('failed blob')], path, rows_per_batch=3) == 7
+    assert read(path) == rows
+
+@pytest.mark.parametrize('write,read', writers)
+def test_row_outside_inferred_schema(write, read, tmp_path):
+    path = str(tmp_path / 'out')
+    rows = [{'a': i, 'b': {'x': 1}} for i in range(5)] + [{'a': 9, 'b': {'x': 2, 'y': 'new'}}]
+    with pytest.raises(ValueError):
+        write(rows, path, rows_per_batch=2)
+    assert not os.path.exists(path)
+    assert write(rows, path, rows_per_batch=2, infer_rows=10) == 6
+    assert read(path)[-1] == {'a': 9, 'b': {'x': 2, 'y': 'new'}}
+
+def test_mixed_types_are_strings(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    rows = [{'a': 1}, {'a': 's'}, {'a': 2.5}]
+    assert nd.write_plists_to_parquet_file(rows, path) == 3
+    assert read_parquet(path) == [{'a': '1'}, {'a': 's'}, {'a': '2.5'}]
+
+def test_given_schema(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    rows = [{'a': 1, 'b': 'left out'}, {'c': 2}, [1, 2]]
+    assert nd.write_plists_to_parquet_file(rows, path, schema=pa.schema([('a', pa.int64())])) == 3
+    assert read_parquet(path) == [{'a': 1}, {'a': None}, {'a': None}]
+
+def test_list_plists_are_a_root_column(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    assert nd.write_plists_to_parquet_file([[1, 2], [3]], path) == 2
+    assert read_parquet(path) == [{'root': [1, 2]}, {'root': [3]}]
+
+def test_no_rows(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    assert nd.write_plists_to_parquet_file([], path) == 0
+    assert os.path.exists(path)
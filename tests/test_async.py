@@ -0,0 +1,63 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder, corpus_path
+
+def blob(i):
+    b = ArchiveBuilder()
+    return b.binary(b.dict(['index'], [b.add(i)]))
+
+class AsyncFile:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        await asyncio.sleep(0)
+        return self.data
+
+async def async_blobs(blobs):
+    for data in blobs:
+        await asyncio.sleep(0)
+        yield data
+
+def test_deserialize_plist_async():
+    path = corpus_path('basic.bplist')
+    expected = nd.deserialize_plist(path)
+    async def main():
+        with open(path, 'rb') as f:
+            results = [await nd.deserialize_plist_async(path), await nd.deserialize_plist_async(f)]
+        with open(path, 'rb') as f:
+            data = f.read()
+        results += [await nd.deserialize_plist_async(data), await nd.deserialize_plist_async(AsyncFile(data))]
+        return results
+    assert asyncio.run(main()) == [expected] * 4
+
+def test_deserialize_plist_async_raises():
+    with pytest.raises(Exception):
+        asyncio.run(nd.deserialize_plist_async(b'not a plist'))
+
+@pytest.mark.parametrize('executor_class', [None, concurrent.futures.ThreadPoolExecutor, concurrent.futures.ProcessPoolExecutor])
+def test_deserialize_many_async(executor_class):
+    blobs = [blob(i) for i in range(50)] + [b'not a plist']
+    async def main(executor):
+        return [result async for result in nd.deserialize_many_async(async_blobs(blobs), format=dict,
+                                                                     executor=executor, max_concurrency=4)]
+    if executor_class is None:
+        results = asyncio.run(main(None))
+    else:
+        with executor_class(2) as executor:
+            results = asyncio.run(main(executor))
+    assert results[:-1] == [{'index': i} for i in range(50)]
+    assert isinstance(results[-1], Exception)
+
+def test_deserialize_many_async_stopped_early():
+    async def main():
+        results = nd.deserialize_many_async([blob(i) for i in range(50)], format=dict)
+        first = await results.__anext__()
+        await results.aclose()
+        return first
+    assert asyncio.run(main()) == {'index': 0}
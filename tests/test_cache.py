@@ -0,0 +1,78 @@
+import pytest
+
+import ccl_bplist
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder
+
+def url_archive(i=0):
+    b = ArchiveBuilder()
+    url = b.add({'$class': b.cls('NSURL'), 'NS.relative': b.add('http://x/{}'.format(i))})
+    return b.binary(b.dict(['url'], [url]))
+
+def to_url(obj):
+    return obj['NS.relative']
+
+def test_repeated_blobs_are_cached():
+    cache = nd.ResultCache()
+    deserializer = nd.Deserializer(cache=cache)
+    first = deserializer.deserialize_plist_from_string(url_archive(), format=dict)
+    second = deserializer.deserialize_plist_from_string(url_archive(), format=dict)
+    assert first == second == {'url': {'NS.relative': 'http://x/0'}}
+    second['url']['NS.relative'] = 'changed' # each hit is a copy
+    assert deserializer.deserialize_plist_from_string(url_archive(), format=dict) == first
+    deserializer.deserialize_plist_from_string(url_archive(), format=list) # other options, another key
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 2, 2)
+
+def test_eviction():
+    cache = nd.ResultCache(max_entries=3)
+    deserializer = nd.Deserializer(cache=cache)
+    for i in range(5):
+        deserializer.deserialize_plist_from_string(url_archive(i))
+    assert cache.stats()['entries'] == 3
+    assert cache.stats()['evictions'] == 2
+    too_small = nd.ResultCache(max_bytes=10)
+    nd.Deserializer(cache=too_small).deserialize_plist_from_string(url_archive())
+    assert too_small.stats()['entries'] == 0
+
+def test_database_is_reused(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    with nd.ResultCache(path=path) as cache:
+        result = nd.Deserializer(cache=cache).deserialize_plist_from_string(url_archive())
+    with nd.ResultCache(path=path) as cache:
+        assert nd.Deserializer(cache=cache).deserialize_plist_from_string(url_archive()) == result
+        assert cache.stats()['disk_hits'] == 1
+
+def test_registering_a_class_converter_changes_the_key(tmp_path, class_converters):
+    path = str(tmp_path / 'cache.db')
+    with nd.ResultCache(path=path) as cache:
+        deserializer = nd.Deserializer(cache=cache)
+        assert deserializer.deserialize_plist_from_string(url_archive(), format=dict) == {'url': {'NS.relative': 'http://x/0'}}
+        ccl_bplist.register_class_converter('NSURL', to_url, ('NS.relative',))
+        assert deserializer.deserialize_plist_from_string(url_archive(), format=dict) == {'url': 'http://x/0'}
+        assert cache.stats()['hits'] == 0
+
+def test_lambda_converters_are_not_cached(class_converters):
+    cache = nd.ResultCache()
+    deserializer = nd.Deserializer(object_converter=lambda obj: ccl_bplist.NSKeyedArchiver_common_objects_convertor(obj), cache=cache)
+    deserializer.deserialize_plist_from_string(url_archive())
+    assert cache.stats()['entries'] == 0
+    ccl_bplist.register_class_converter('NSURL', lambda obj: obj['NS.relative'], ('NS.relative',))
+    nd.Deserializer(cache=cache).deserialize_plist_from_string(url_archive())
+    assert cache.stats()['entries'] == 0
+
+def test_exceptions_are_not_cached():
+    cache = nd.ResultCache()
+    deserializer = nd.Deserializer(cache=cache)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            deserializer.deserialize_plist_from_string(b'bplist00 broken')
+    assert cache.stats()['entries'] == 0
+
+def test_cache_in_deserialize_many(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    blobs = [url_archive(i % 10) for i in range(300)]
+    with nd.ResultCache(path=path) as cache:
+        results = nd.Deserializer(cache=cache).deserialize_many(blobs, format=dict, workers=2)
+    assert results == [{'url': {'NS.relative': 'http://x/{}'.format(i % 10)}} for i in range(300)]
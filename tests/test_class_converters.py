@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+
+import ccl_bplist
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder
+
+def url_archive(**fields):
+    b = ArchiveBuilder()
+    url = b.add(dict({'$class': b.cls('NSURL')}, **{k: b.add(v) for k, v in fields.items()}))
+    return b.binary(b.dict(['url'], [url]))
+
+def to_url(obj):
+    return obj['NS.relative']
+
+def test_built_in_classes():
+    b = ArchiveBuilder()
+    values = [b.add({'$class': b.cls('NSDate'), 'NS.time': 10.5}),
+              b.add({'$class': b.cls('NSUUID'), 'NS.uuidbytes': bytes(range(16))}),
+              b.add({'$class': b.cls('NSMutableString'), 'NS.string': 'str'}),
+              b.array([b.add('b'), b.add('a')], 'NSMutableSet')]
+    plist = nd.deserialize_plist_from_string(b.binary(b.dict(['date', 'uuid', 'string', 'set'], values)), format=dict)
+    assert plist == {'date': datetime.datetime(2001, 1, 1, 0, 0, 10, 500000),
+                     'uuid': '00010203-0405-0607-0809-0A0B0C0D0E0F', 'string': 'str', 'set': ['b', 'a']}
+
+def test_unknown_class_is_left_as_dict():
+    plist = nd.deserialize_plist_from_string(url_archive(**{'NS.relative': 'http://x'}), format=dict)
+    assert plist == {'url': {'NS.relative': 'http://x'}}
+
+def test_register_class_converter(class_converters):
+    ccl_bplist.register_class_converter('NSURL', to_url, ('NS.relative',))
+    plist = nd.deserialize_plist_from_string(url_archive(**{'NS.relative': 'http://x'}), format=dict)
+    assert plist == {'url': 'http://x'}
+
+def test_objects_without_required_keys_are_unchanged(class_converters):
+    ccl_bplist.register_class_converter(['NSURL', 'NSMutableURL'], to_url, ('NS.relative',))
+    plist = nd.deserialize_plist_from_string(url_archive(**{'NS.base': 'http://x'}), format=dict)
+    assert plist == {'url': {'NS.base': 'http://x'}}
+
+def test_class_names_must_match_exactly(class_converters):
+    ccl_bplist.register_class_converter('NSURLs', to_url, ('NS.relative',))
+    plist = nd.deserialize_plist_from_string(url_archive(**{'NS.relative': 'http://x'}), format=dict)
+    assert plist == {'url': {'NS.relative': 'http://x'}}
+
+def test_register_requires_a_function(class_converters):
+    with pytest.raises(TypeError):
+        ccl_bplist.register_class_converter('NSURL', 'not a function')
+
+def test_get_classname():
+    b = ArchiveBuilder()
+    root = b.dict(['k'], [b.add('v')])
+    objects = ccl_bplist.loads(b.binary(root))['$objects']
+    table = ccl_bplist.NsKeyedArchiverObjectTable(objects)
+    assert ccl_bplist.get_classname(ccl_bplist.NsKeyedArchiverDictionary(objects[root.data], table)) == 'NSDictionary'
+    assert table.classnames == {objects[root.data]['$class'].value: 'NSDictionary'}
+    assert ccl_bplist.get_classname({'$class': {'$classname': 'NSArray'}}) == 'NSArray'
+    assert ccl_bplist.get_classname({'no': 'class'}) is None
+    assert ccl_bplist.get_classname('NSDictionary') is None
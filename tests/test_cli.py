@@ -0,0 +1,63 @@
+import json
+import os
+import plistlib
+import subprocess
+import sys
+
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder
+
+def write_archive(path, i):
+    b = ArchiveBuilder()
+    date = b.add({'$class': b.cls('NSDate'), 'NS.time': 1e300}) # logs a warning, converted to ''
+    data = b.binary(b.dict(['index', 'date'], [b.add(i), date]))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@pytest.fixture
+def extraction(tmp_path):
+    '''A folder with 6 archives (2 in a subfolder), a text file, a plist that is not NSKA and a broken archive'''
+    root = tmp_path / 'extraction'
+    (root / 'sub').mkdir(parents=True)
+    for i in range(4):
+        write_archive(str(root / 'a{}.plist'.format(i)), i)
+    for i in range(4, 6):
+        write_archive(str(root / 'sub' / 'a{}.plist'.format(i)), i)
+    (root / 'notes.txt').write_text('not a plist')
+    (root / 'plain.plist').write_bytes(plistlib.dumps({'a': 1}, fmt=plistlib.FMT_BINARY))
+    (root / 'broken.plist').write_bytes(b'bplist00$archiver')
+    return root
+
+def test_json_output_folder(extraction, tmp_path, capsys):
+    output = tmp_path / 'out'
+    assert nd.main([str(extraction), '-o', str(output), '-d', '-w', '1']) == 1
+    with open(str(output / 'sub' / 'a5.plist_deserialized.json')) as f:
+        assert json.load(f) == {'index': '5', 'date': ''}
+    assert len(list(output.rglob('*.json'))) == 6
+    assert 'Converted 6 of 9 files, 1 errors, 2 skipped' in capsys.readouterr().err
+
+def test_plist_output_next_to_files(extraction):
+    assert nd.main([str(extraction / 'sub'), '-f', 'plist', '-w', '1']) == 0
+    with open(str(extraction / 'sub' / 'a4.plist_deserialized.plist'), 'rb') as f:
+        assert plistlib.load(f) == {'index': 4, 'date': ''}
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_jsonl_to_stdout_has_only_records(extraction, workers):
+    script = os.path.join(os.path.dirname(os.path.abspath(nd.__file__)), 'nska_deserialize.py')
+    process = subprocess.run([sys.executable, script, str(extraction), '-f', 'jsonl', '-d', '-w', workers],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.returncode == 1
+    records = [json.loads(line) for line in process.stdout.decode('utf8').splitlines()]
+    assert sorted(record['plist']['index'] for record in records) == ['0', '1', '2', '3', '4', '5']
+    assert b'Error in' in process.stderr
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs fifos')
+def test_fifos_are_skipped(extraction, tmp_path, capsys):
+    os.mkfifo(str(extraction / 'fifo'))
+    output = tmp_path / 'all.jsonl'
+    assert nd.main([str(extraction), '-f', 'jsonl', '-o', str(output), '-q', '-w', '1']) == 1
+    assert len(output.read_text().splitlines()) == 6
+    assert '3 skipped' in capsys.readouterr().err
@@ -0,0 +1,51 @@
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder, corpus_names, corpus_path, expected_results, nested_archive, outcome, unwrap
+
+formats = {'list': list, 'dict': dict}
+
+@pytest.mark.parametrize('name', corpus_names())
+def test_corpus_matches_expected(name):
+    path = corpus_path(name)
+    with open(path, 'rb') as f:
+        data = f.read()
+    for (full_recurse, format_name), expected in expected_results(name).items():
+        format = formats[format_name]
+        assert outcome(nd.deserialize_plist, path, full_recurse, format) == expected
+        with open(path, 'rb') as f:
+            assert outcome(nd.deserialize_plist, f, full_recurse, format) == expected
+        assert outcome(nd.deserialize_plist_from_string, data, full_recurse, format) == expected
+
+@pytest.mark.parametrize('kinds', [('NSDictionary',), ('NSArray',), ('NSSet',), ('NSDictionary', 'NSSet'),
+                                   ('NSArray', 'NSDictionary')])
+def test_deeply_nested(kinds):
+    plist = nd.deserialize_plist_from_string(nested_archive(3000, kinds), format=dict)
+    assert unwrap(plist) == ('leaf', 3000)
+
+def test_wide_array():
+    b = ArchiveBuilder()
+    root = b.array([b.add(i) for i in range(10000)])
+    assert nd.deserialize_plist_from_string(b.binary(root), format=dict) == list(range(10000))
+
+@pytest.mark.parametrize('classname', ['NSArray', 'NSSet'])
+def test_container_containing_itself(classname):
+    b = ArchiveBuilder()
+    uid = b.reserve()
+    b.set(uid, {'$class': b.cls(classname), 'NS.objects': [uid]})
+    assert nd.deserialize_plist_from_string(b.binary(uid), format=dict) == [[]]
+
+def test_cycle_through_set():
+    b = ArchiveBuilder()
+    dict_uid = b.reserve()
+    set_uid = b.array([dict_uid], 'NSSet')
+    b.set(dict_uid, b.dict_object(['a'], [set_uid]))
+    assert nd.deserialize_plist_from_string(b.binary(set_uid), format=dict) == [{'a': []}]
+
+def test_shared_objects_are_copies():
+    b = ArchiveBuilder()
+    shared = b.dict(['k'], [b.add('v')])
+    plist = nd.deserialize_plist_from_string(b.binary(b.array([shared, shared])), format=dict)
+    assert plist == [{'k': 'v'}, {'k': 'v'}]
+    assert plist[0] is not plist[1]
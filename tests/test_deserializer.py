@@ -0,0 +1,37 @@
+import concurrent.futures
+
+import ccl_bplist
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder
+
+def dated_archive(i):
+    b = ArchiveBuilder()
+    date = b.add({'$class': b.cls('NSDate'), 'NS.time': float(i)})
+    return b.binary(b.dict(['index', 'date'], [b.add(i), date]))
+
+def date_as_seconds(obj):
+    if ccl_bplist.get_classname(obj) == 'NSDate':
+        return obj['NS.time']
+    return ccl_bplist.NSKeyedArchiver_common_objects_convertor(obj)
+
+def test_object_converter_is_per_deserializer():
+    plain = nd.Deserializer()
+    seconds = nd.Deserializer(object_converter=date_as_seconds)
+    def convert(i):
+        return (plain.deserialize_plist_from_string(dated_archive(i), format=dict),
+                seconds.deserialize_plist_from_string(dated_archive(i), format=dict))
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        for i, (default_result, seconds_result) in enumerate(pool.map(convert, range(200))):
+            assert default_result['date'] == nd.deserialize_plist_from_string(dated_archive(i), format=dict)['date']
+            assert seconds_result == {'index': i, 'date': float(i)}
+
+def test_share_objects():
+    b = ArchiveBuilder()
+    shared = b.dict(['k'], [b.add('v')])
+    data = b.binary(b.array([shared, shared]))
+    copies = nd.Deserializer().deserialize_plist_from_string(data, format=dict)
+    assert copies[0] == copies[1] and copies[0] is not copies[1]
+    shared_result = nd.Deserializer(share_objects=True).deserialize_plist_from_string(data, format=dict)
+    assert shared_result == copies
+    assert shared_result[0] is shared_result[1]
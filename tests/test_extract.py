@@ -0,0 +1,62 @@
+import datetime
+import io
+
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder, corpus_names, corpus_path, expected_results
+
+def sfl2_like():
+    b = ArchiveBuilder()
+    rows = []
+    for i in range(3):
+        date = b.add({'$class': b.cls('NSDate'), 'NS.time': float(i)})
+        rows.append(b.dict(['URL', 'name', 'date'], [b.add('file:///doc{}'.format(i)), b.add('doc {}'.format(i)), date]))
+    return b.binary(b.dict(['items', 'a.b', 'count'], [b.array(rows), b.add('dotted'), b.add(3)]))
+
+def paths_of(value, path, depth=0):
+    '''Yields (path, value) for value and everything in it, down to depth 6'''
+    yield path, value
+    if depth == 6:
+        return
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if k and '[' not in k and ']' not in k:
+                yield from paths_of(v, path + '.' + k, depth + 1)
+    elif isinstance(value, list):
+        for i, v in enumerate(value[:5]):
+            yield from paths_of(v, '{}[{}]'.format(path, i), depth + 1)
+
+def test_extract():
+    data = sfl2_like()
+    urls, name, dotted, count, missing = nd.extract(data, ['root.items[*].URL', 'root.items[1].name', 'root.a.b',
+                                                           'root.count', 'root.items[5].name'], default='none')
+    assert urls == ['file:///doc0', 'file:///doc1', 'file:///doc2']
+    assert name == 'doc 1'
+    assert dotted == 'dotted'
+    assert count == 3
+    assert missing == 'none'
+
+def test_compiled_selector():
+    selector = nd.compile_selector(['root.items[-1].date', 'root.items'])
+    date, items = selector.extract(sfl2_like())
+    assert date == datetime.datetime(2001, 1, 1, 0, 0, 2)
+    assert items == nd.deserialize_plist_from_string(sfl2_like(), format=dict)['items']
+    assert repr(selector) == "Selector(['root.items[-1].date', 'root.items'])"
+
+@pytest.mark.parametrize('path', ['', 'root.', '.root', 'root..a', '[0]', 'root[x]', 'root[0]a'])
+def test_invalid_paths(path):
+    with pytest.raises(ValueError):
+        nd.compile_selector(path)
+
+@pytest.mark.parametrize('name', [n for n in corpus_names() if expected_results(n)[(False, 'dict')][0] == 'ok'])
+def test_corpus_paths_match_full_result(name):
+    with open(corpus_path(name), 'rb') as f:
+        data = f.read()
+    roots = nd._get_root_element_names(nd._get_valid_nska_plist(io.BytesIO(data)))
+    plist = expected_results(name)[(False, 'dict')][1]
+    if len(roots) == 1: # format=dict gives the root itself
+        plist = {roots[0]: plist}
+    expected = [item for root, value in plist.items() for item in paths_of(value, root)][:300]
+    assert nd.extract(data, [path for path, _ in expected]) == [value for _, value in expected]
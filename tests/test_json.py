@@ -0,0 +1,88 @@
+import base64
+import datetime
+import json
+
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import corpus_names, corpus_path, expected_results, nested_archive
+
+sample = {'str': 'héllo "☃"', 'int': 7, 'float': 2.5, 'true': True, 'none': None, 'bytes': b'\x00\xff',
+          'date': datetime.datetime(2020, 5, 6, 7, 8, 9), 'list': [1, [2, {}], []], 'dict': {'k': {'n': 1}}}
+
+def json_writeable(plist):
+    '''The json the writer has always produced: strings, with bytes in hex'''
+    if isinstance(plist, dict):
+        return {k: json_writeable(v) for k, v in plist.items()}
+    if isinstance(plist, list):
+        return [json_writeable(v) for v in plist]
+    return plist.hex() if isinstance(plist, bytes) else str(plist)
+
+corpus_plists = [(name, options) for name in corpus_names() for options, result in expected_results(name).items()
+                 if result[0] == 'ok' and isinstance(result[1], (dict, list))]
+
+@pytest.mark.parametrize('name,options', corpus_plists)
+def test_same_output_as_json_dump(name, options, tmp_path):
+    plist = expected_results(name)[options][1]
+    output = str(tmp_path / 'out.json')
+    nd.write_plist_to_json_file(plist, output)
+    with open(output, 'rb') as f:
+        assert f.read() == json.dumps(json_writeable(plist)).encode('ascii')
+
+def test_typed_options(tmp_path):
+    output = str(tmp_path / 'out.json')
+    nd.write_plist_to_json_file(sample, output, iso_dates=True, native_numbers=True, bytes_encoding='base64')
+    with open(output) as f:
+        written = json.load(f)
+    assert written == {'str': 'héllo "☃"', 'int': 7, 'float': 2.5, 'true': True, 'none': None,
+                       'bytes': base64.b64encode(b'\x00\xff').decode('ascii'), 'date': '2020-05-06T07:08:09',
+                       'list': [1, [2, {}], []], 'dict': {'k': {'n': 1}}}
+
+def test_invalid_bytes_encoding(tmp_path):
+    with pytest.raises(ValueError):
+        nd.write_plist_to_json_file(sample, str(tmp_path / 'out.json'), bytes_encoding='base32')
+
+def test_deep_plist_and_lazy_views(tmp_path):
+    data = nested_archive(3000, ('NSDictionary', 'NSArray'))
+    eager, lazy = str(tmp_path / 'eager.json'), str(tmp_path / 'lazy.json')
+    nd.write_plist_to_json_file(nd.deserialize_plist_from_string(data, format=dict), eager)
+    nd.write_plist_to_json_file(nd.deserialize_plist_from_string_lazy(data, format=dict), lazy)
+    with open(eager, 'rb') as f, open(lazy, 'rb') as g:
+        assert f.read() == g.read()
+
+def test_jsonl_skips_exceptions(tmp_path):
+    output = str(tmp_path / 'out.jsonl')
+    plists = [sample, ValueError('failed'), [1, 2], nd.DeserializeError('not an archive')]
+    assert nd.write_plists_to_jsonl_file(plists, output, native_numbers=True) == 2
+    with open(output) as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line) for line in lines] == [json.loads(nd.dumps_json(sample, native_numbers=True)), [1, 2]]
+
+backends = ['json', pytest.param('orjson', marks=pytest.mark.skipif(nd.orjson is None, reason='orjson is not installed'))]
+
+@pytest.mark.parametrize('backend', backends)
+@pytest.mark.parametrize('name,options', corpus_plists)
+def test_dumps_json_is_compact_json(name, options, backend):
+    plist = expected_results(name)[options][1]
+    expected = json.dumps(json_writeable(plist), ensure_ascii=False, separators=(',', ':')).encode('utf8')
+    assert nd.dumps_json(plist, backend=backend) == expected
+
+@pytest.mark.parametrize('backend', backends)
+def test_dumps_json_options(backend):
+    for iso_dates in (False, True):
+        for bytes_encoding in ('hex', 'base64'):
+            assert nd.dumps_json(sample, iso_dates, False, bytes_encoding, backend) == \
+                   nd.dumps_json(sample, iso_dates, False, bytes_encoding, 'json')
+    assert json.loads(nd.dumps_json(sample, True, True, backend=backend)) == \
+           json.loads(nd.dumps_json(sample, True, True, backend='json'))
+
+def test_write_with_backend(tmp_path):
+    output = str(tmp_path / 'out.json')
+    nd.write_plist_to_json_file(sample, output, backend='auto')
+    with open(output, 'rb') as f:
+        assert f.read() == nd.dumps_json(sample)
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        nd.dumps_json(sample, backend='ujson')
@@ -0,0 +1,66 @@
+import pytest
+
+import ccl_bplist
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder, corpus_names, corpus_path, expected_results, nested_archive, outcome, unwrap
+
+formats = {'list': list, 'dict': dict}
+
+def lazy_outcome(data, full_recurse, format):
+    return outcome(lambda: nd.materialize_plist(nd.deserialize_plist_from_string_lazy(data, full_recurse, format)))
+
+@pytest.mark.parametrize('name', corpus_names())
+def test_materialized_view_matches_expected(name):
+    with open(corpus_path(name), 'rb') as f:
+        data = f.read()
+    for (full_recurse, format_name), expected in expected_results(name).items():
+        assert lazy_outcome(data, full_recurse, formats[format_name]) == expected
+
+def test_views_equal_eager_result():
+    path = corpus_path('basic.bplist')
+    view = nd.deserialize_plist_lazy(path, format=dict)
+    assert isinstance(view, nd.NskaLazyDict)
+    assert isinstance(view['arr'], nd.NskaLazyList)
+    assert view == nd.deserialize_plist(path, format=dict)
+    assert view.to_plist() == nd.deserialize_plist(path, format=dict)
+
+def test_only_accessed_objects_are_converted():
+    b = ArchiveBuilder()
+    rows = [b.dict(['name'], [b.add('row {}'.format(i))]) for i in range(100)]
+    data = b.binary(b.dict(['rows'], [b.array(rows)]))
+    converted = []
+    def converter(obj):
+        converted.append(obj)
+        return ccl_bplist.NSKeyedArchiver_common_objects_convertor(obj)
+    deserializer = nd.Deserializer(object_converter=converter)
+    deserializer.deserialize_plist_from_string(data, format=dict)
+    eager_count = len(converted)
+    del converted[:]
+    view = deserializer.deserialize_plist_from_string_lazy(data, format=dict)
+    assert view['rows'][42]['name'] == 'row 42'
+    assert len(converted) * 10 < eager_count
+    assert len(view['rows']) == 100
+
+def test_deeply_nested_view():
+    view = nd.deserialize_plist_from_string_lazy(nested_archive(3000, ('NSDictionary', 'NSArray')), format=dict)
+    assert unwrap(nd.materialize_plist(view)) == ('leaf', 3000)
+
+@pytest.mark.parametrize('classname', ['NSArray', 'NSSet'])
+def test_view_of_container_containing_itself(classname):
+    b = ArchiveBuilder()
+    uid = b.reserve()
+    b.set(uid, {'$class': b.cls(classname), 'NS.objects': [b.add('x'), uid]})
+    view = nd.deserialize_plist_from_string_lazy(b.binary(uid), format=dict)
+    assert view[0] == 'x'
+    assert list(view) == ['x', ['x']]
+    assert nd.materialize_plist(view) == nd.deserialize_plist_from_string(b.binary(uid), format=dict)
+
+def test_views_are_read_only():
+    view = nd.deserialize_plist_lazy(corpus_path('basic.bplist'), format=dict)
+    with pytest.raises(TypeError):
+        view['str'] = 'changed'
+    with pytest.raises(KeyError):
+        view['missing']
+    with pytest.raises(IndexError):
+        view['arr'][10]
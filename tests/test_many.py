@@ -0,0 +1,45 @@
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder
+
+def blob(i):
+    b = ArchiveBuilder()
+    return b.binary(b.dict(['index', 'items'], [b.add(i), b.array([b.add('item {}'.format(j)) for j in range(i % 5)])]))
+
+def expected(i):
+    return {'index': i, 'items': ['item {}'.format(j) for j in range(i % 5)]}
+
+@pytest.fixture
+def blobs():
+    blobs = [blob(i) for i in range(200)]
+    blobs[7] = b'not a plist'
+    blobs[13] = b'bplist00 but broken'
+    return blobs
+
+def check_results(results, count):
+    assert len(results) == count
+    for i, result in enumerate(results):
+        if i in (7, 13):
+            assert isinstance(result, Exception)
+        else:
+            assert result == expected(i)
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_deserialize_many(blobs, workers):
+    check_results(nd.deserialize_many(blobs, format=dict, workers=workers, chunksize=16), len(blobs))
+
+def test_deserialize_many_equals_loop(blobs):
+    loop = []
+    for data in blobs:
+        try:
+            loop.append(nd.deserialize_plist_from_string(data, format=dict))
+        except Exception as ex:
+            loop.append(ex)
+    results = nd.deserialize_many(iter(blobs), format=dict, workers=2)
+    assert [r for r in results if not isinstance(r, Exception)] == [r for r in loop if not isinstance(r, Exception)]
+    assert [type(r) for r in results] == [type(r) for r in loop]
+
+def test_deserialize_many_empty():
+    assert nd.deserialize_many([], workers=4) == []
@@ -0,0 +1,56 @@
+import concurrent.futures
+import plistlib
+
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder
+
+def inner_archive(value):
+    b = ArchiveBuilder()
+    return b.binary(b.dict(['value'], [b.add(value)]))
+
+def outer_plist():
+    '''A plain (not NSKA) plist with nested archives, a nested plain plist and other data'''
+    return plistlib.dumps({'a': inner_archive('first'), 'items': [{'data': inner_archive('second')}, b'xx'],
+                           'plain': plistlib.dumps({'p': 1}, fmt=plistlib.FMT_BINARY), 'big': inner_archive('x' * 5000)},
+                          fmt=plistlib.FMT_BINARY)
+
+def test_full_recurse():
+    plist = nd.deserialize_plist_from_string(outer_plist(), True, dict)
+    assert plist == {'a': {'value': 'first'}, 'items': [{'data': {'value': 'second'}}, b'xx'], 'plain': {'p': 1},
+                     'big': {'value': 'x' * 5000}}
+
+def test_nested_stats():
+    deserializer = nd.Deserializer()
+    deserializer.deserialize_plist_from_string(outer_plist(), True, dict)
+    assert deserializer.get_nested_stats() == {'scanned': 5, 'converted': 4, 'not_plist': 1, 'no_archiver': 0, 'skipped_size': 0}
+    deserializer.reset_nested_stats()
+    assert deserializer.get_nested_stats()['scanned'] == 0
+
+def test_archivers_only_and_sizes():
+    deserializer = nd.Deserializer(nested_archivers_only=True, nested_max_size=1000)
+    plist = deserializer.deserialize_plist_from_string(outer_plist(), True, dict)
+    assert plist['a'] == {'value': 'first'}
+    assert isinstance(plist['plain'], bytes) and isinstance(plist['big'], bytes)
+    stats = deserializer.get_nested_stats()
+    assert (stats['no_archiver'], stats['skipped_size']) == (1, 1)
+    plist = nd.Deserializer(nested_min_size=1000).deserialize_plist_from_string(outer_plist(), True, dict)
+    assert isinstance(plist['a'], bytes) and plist['big'] == {'value': 'x' * 5000}
+
+@pytest.mark.parametrize('paths,converted', [(['items[*].data'], {'items'}), (['a', 'plain'], {'a', 'plain'}),
+                                             (['*'], {'a', 'plain', 'big', 'items'}), (['items[1]'], set())])
+def test_key_paths(paths, converted):
+    plist = nd.Deserializer(nested_key_paths=paths).deserialize_plist_from_string(outer_plist(), True, dict)
+    full = nd.deserialize_plist_from_string(outer_plist(), True, dict)
+    for key in ('a', 'plain', 'big'):
+        assert (plist[key] == full[key]) == (key in converted)
+    assert (plist['items'] == full['items']) == ('items' in converted)
+
+def test_nested_executor():
+    expected = nd.deserialize_plist_from_string(outer_plist(), True, dict)
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        deserializer = nd.Deserializer(nested_executor=executor)
+        assert deserializer.deserialize_plist_from_string(outer_plist(), True, dict) == expected
+        assert deserializer.get_nested_stats()['converted'] == 4
@@ -0,0 +1,59 @@
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder, corpus_path
+
+def sample_archive():
+    b = ArchiveBuilder()
+    date = b.add({'$class': b.cls('NSDate'), 'NS.time': 1.0})
+    url = b.add({'$class': b.cls('NSURL'), 'NS.relative': b.add('http://x'), 'NS.flags': 3, 'NS.data': b'\x01'})
+    root = b.dict(['url', 'date', 'big'], [url, date, b.add(2 ** 63 + 5)])
+    return b, root, b.binary(root)
+
+def test_rows():
+    b, root, data = sample_archive()
+    table = nd.get_objects_table_from_string(data)
+    assert len(table) == len(b.objects)
+    assert table.top == {'root': root.data}
+    url = table.uids_of_class('NSURL')
+    assert len(url) == 1
+    uid, classname, value, fields, refs = table[url[0]]
+    assert (classname, value, fields) == ('NSURL', None, {'NS.flags': 3, 'NS.data': b'\x01'})
+    assert table.values[refs['NS.relative']] == 'http://x'
+    assert table.classnames[root.data] == 'NSDictionary'
+    assert len(table.refs[root.data]['NS.objects']) == 3
+    assert table.values[0] is None # $null
+    assert list(table)[uid] == table[uid]
+
+def test_from_file():
+    path = corpus_path('basic.bplist')
+    with open(path, 'rb') as f:
+        assert nd.get_objects_table(path).values == nd.get_objects_table_from_string(f.read()).values
+
+def test_not_an_archive():
+    with pytest.raises(nd.DeserializeError):
+        nd.get_objects_table(corpus_path('plain.bplist'))
+
+def test_to_numpy():
+    np = pytest.importorskip('numpy')
+    _, root, data = sample_archive()
+    columns = nd.get_objects_table_from_string(data).to_numpy()
+    assert columns['uid'].dtype == np.int64
+    assert columns['classname'][root.data] == 'NSDictionary'
+    assert isinstance(columns['refs'][root.data]['NS.keys'], list)
+
+def test_to_arrow():
+    pytest.importorskip('pyarrow')
+    _, root, data = sample_archive()
+    table = nd.get_objects_table_from_string(data)
+    arrow = table.to_arrow()
+    assert arrow.num_rows == len(table)
+    rows = arrow.to_pylist()
+    assert rows[root.data]['classname'] == 'NSDictionary'
+    assert table.values.index('http://x') == [r['str_value'] for r in rows].index('http://x')
+    assert str(2 ** 63 + 5) in [r['str_value'] for r in rows]
+    date = table.uids_of_class('NSDate')[0]
+    assert rows[date]['fields'] == [('NS.time', '1.0')]
+    assert rows[root.data]['refs'][0][0] == 'NS.keys'
+    assert arrow.schema.metadata[b'nska.top'] == b'{"root": %d}' % root.data
@@ -0,0 +1,28 @@
+import copy
+import pickle
+
+import pytest
+
+import ccl_bplist
+
+@pytest.mark.parametrize('value', [5, 5000])
+def test_uid_is_read_only(value):
+    uid = ccl_bplist.BplistUID(value)
+    with pytest.raises(AttributeError):
+        uid.value = 1
+    with pytest.raises(AttributeError):
+        del uid.value
+    with pytest.raises(AttributeError):
+        uid.other = 1
+    assert uid.value == value
+
+def test_small_uids_are_interned():
+    assert ccl_bplist.BplistUID(5) is ccl_bplist.BplistUID(5)
+    assert ccl_bplist.BplistUID(5000) == ccl_bplist.BplistUID(5000)
+
+@pytest.mark.parametrize('value', [5, 5000])
+def test_uid_copies(value):
+    uid = ccl_bplist.BplistUID(value)
+    for copied in (pickle.loads(pickle.dumps(uid)), copy.copy(uid), copy.deepcopy(uid)):
+        assert copied == uid and copied.value == value
+    assert pickle.loads(pickle.dumps(ccl_bplist.BplistUID(5))) is ccl_bplist.BplistUID(5)
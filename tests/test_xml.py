@@ -0,0 +1,78 @@
+import datetime
+import io
+import plistlib
+import xml.parsers.expat
+
+import pytest
+
+import nska_deserialize as nd
+
+from helpers import ArchiveBuilder, corpus_path
+
+plain_plist = {
+    'string': 'héllo & <world>', 'int': -42, 'big': 2 ** 40, 'real': 2.5, 'true': True, 'false': False,
+    'date': datetime.datetime(2020, 5, 6, 7, 8, 9), 'data': b'\x00\x01' * 100,
+    'list': [1, [2, {'three': 3}], {}], 'empty': '', 'dict': {'nested': {'deeper': ['x']}},
+}
+
+def xml_uids(value):
+    '''Returns value with UIDs as CF$UID dicts, which is how xml archives have them'''
+    if isinstance(value, plistlib.UID):
+        return {'CF$UID': value.data}
+    if isinstance(value, dict):
+        return {k: xml_uids(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [xml_uids(v) for v in value]
+    return value
+
+def xml_archive(b, root):
+    return plistlib.dumps(xml_uids(b.archive(root)), fmt=plistlib.FMT_XML, sort_keys=False)
+
+def test_parser_matches_plistlib():
+    data = plistlib.dumps(plain_plist, fmt=plistlib.FMT_XML)
+    assert nd._XmlPlistParser().parse(io.BytesIO(data)) == plistlib.loads(data)
+
+def test_parsed_in_chunks(monkeypatch):
+    data = plistlib.dumps(plain_plist, fmt=plistlib.FMT_XML)
+    monkeypatch.setattr(nd._XmlPlistParser, 'chunk_size', 7)
+    assert nd._XmlPlistParser().parse(io.BytesIO(data)) == plistlib.loads(data)
+
+def test_xml_archive_equals_binary_archive():
+    b = ArchiveBuilder()
+    root = b.dict(['name', 'items'], [b.add('n'), b.array([b.add(1), b.add(2.5), b.dict(['k'], [b.add('v')])])])
+    expected = nd.deserialize_plist_from_string(b.binary(root), format=dict)
+    assert expected == {'name': 'n', 'items': [1, 2.5, {'k': 'v'}]}
+    assert nd.deserialize_plist_from_string(xml_archive(b, root), format=dict) == expected
+
+def test_hex_integers():
+    b = ArchiveBuilder()
+    root = b.array([b.add(i * 7919) for i in range(1000)])
+    data = xml_archive(b, root)
+    for i in range(1000):
+        data = data.replace(b'<integer>%d</integer>' % (i * 7919), b'<integer>0x%x</integer>' % (i * 7919))
+    assert b'0x' in data
+    assert nd.deserialize_plist_from_string(data, format=dict) == [i * 7919 for i in range(1000)]
+
+def test_leading_whitespace_and_invalid_utf8():
+    path = corpus_path('badutf8_ws.xml')
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.startswith((b' ', b'\n', b'\r', b'\t'))
+    with pytest.raises(UnicodeDecodeError):
+        data.decode('utf8')
+    assert nd.deserialize_plist(path, format=dict) == nd.deserialize_plist_from_string(data.lstrip(), format=dict)
+
+def test_malformed_xml_raises():
+    data = plistlib.dumps(plain_plist, fmt=plistlib.FMT_XML)
+    with pytest.raises(xml.parsers.expat.ExpatError):
+        nd._XmlPlistParser().parse(io.BytesIO(data.replace(b'</dict>', b'</array>', 1)))
+
+def test_entity_declarations_are_rejected():
+    data = (b'<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE plist [<!ENTITY e "entity">]>\n'
+            b'<plist version="1.0"><string>&e;</string></plist>')
+    with pytest.raises(plistlib.InvalidFileException):
+        nd._XmlPlistParser().parse(io.BytesIO(data))
+
+def test_not_xml_raises():
+    with pytest.raises(plistlib.InvalidFileException):
+        nd._XmlPlistParser().parse(io.BytesIO(b'not a plist'))